@@ -0,0 +1,141 @@
+"""Micro-benchmark for parsing the use-by sections of a receipt.
+
+Compares the single pass BBDLists parser used by receipt_parse with the previous approach, HeaderIndex and
+FindEndIndex scans followed by update_bbds for each section, over a synthetic 200 item receipt. Both must give the
+same lists, the single pass parser also reading each item's quantities and price rather than dropping them.
+
+Run from the repository root with: python -m benchmarks.bench_bbds
+"""
+
+from datetime import datetime, timedelta
+import re
+import timeit
+
+from custom_components.ocado.const import (
+    LONG_DAYS,
+    REGEX_AMOUNT,
+    REGEX_COLUMNS,
+    REGEX_DATE_FULL,
+    REGEX_EACH,
+    REGEX_END_INDEX,
+    STRING_FREEZER,
+    STRING_HEADER,
+    STRING_NO_BBD,
+    STRING_PLUS,
+    OcadoEmail,
+)
+from custom_components.ocado.utils import capitalise, receipt_parse
+
+ITEMS = 200
+REPEAT = 40
+NUMBER = 5
+
+
+def build_receipt() -> list[str]:
+    """A receipt for Sunday 22 June 2025 with the items spread over the week, both sections and a page break."""
+    lines = ["Ocado"] * 6 + ["Delivery date 22/06/2025", "Order 1001"]
+    for section, count in (("Fridge", ITEMS * 3 // 4), ("Cupboard", ITEMS // 4)):
+        lines += ["Ocado", "Summary"] if section == "Cupboard" else []
+        lines += [section, "Use by end of tomorrow"]
+        for i in range(count):
+            if i and i % (count // 7 + 1) == 0:
+                lines.append(LONG_DAYS[(i // (count // 7 + 1)) % 7])
+            if i == count // 2:
+                lines += STRING_HEADER + [section]
+            lines += [f"Ocado item number {i} with a long name", f"500g (£1.{i % 100:02d}/each) 1/1 {i % 9 + 1}.50"]
+        lines += [STRING_PLUS, "Long life milk 1l", "1/1 1.00"]
+    return lines + ["You've saved £1.00 today", "Freezer", "Frozen peas 1kg", "1/1 2.00"]
+
+
+def legacy_parse(receipt_list: list[str]) -> list[list[str]]:
+    """The previous parser, kept here to compare against."""
+    receipt_list = list(receipt_list)
+
+    def header_index(string):
+        count = receipt_list.count(string)
+        indices = []
+        if count == 0:
+            return None
+        index = 0
+        while count > 0:
+            index = receipt_list.index(string, index)
+            indices.append(index)
+            index += 1
+            count -= 1
+        first_index = indices.pop(0)
+        for i in range(len(indices)):
+            receipt_list.pop(indices[i])
+        return first_index
+
+    def find_end_index():
+        if STRING_NO_BBD in receipt_list:
+            return receipt_list.index(STRING_NO_BBD)
+        if STRING_FREEZER in receipt_list:
+            return receipt_list.index(STRING_FREEZER)
+        for i in range(len(receipt_list)):
+            if re.search(REGEX_END_INDEX, receipt_list[i]):
+                return i
+        return -1
+
+    def update_bbds(index_start, index_end):
+        delivery_date = datetime.strptime(re.search(REGEX_DATE_FULL, receipt_list[6]).group(), "%d/%m/%Y").date() # type: ignore
+        tomorrow = LONG_DAYS[(delivery_date + timedelta(days=1)).weekday()]
+        reduced_list = receipt_list[index_start + 1:index_end]
+        first_day = reduced_list[0].split(' ')[-1]
+        if first_day == "tomorrow":
+            first_day = tomorrow
+        bbd_lists = [[] for _ in range(8)]
+        active_index = LONG_DAYS.index(first_day)
+        for i in range(1, len(reduced_list)):
+            line = reduced_list[i]
+            if line in LONG_DAYS:
+                active_index = LONG_DAYS.index(line)
+                continue
+            if line == STRING_PLUS:
+                active_index = 7
+                continue
+            if line in STRING_HEADER:
+                continue
+            if re.search(r"^" + REGEX_COLUMNS + r"$", line, flags=re.I):
+                continue
+            bbd_lists[active_index].append(line)
+        updated_bbd_lists = []
+        for day in bbd_lists:
+            if day:
+                day = ' '.join(day)
+                day = re.sub(REGEX_COLUMNS, '\n', day, flags=re.I)
+                day = re.sub(REGEX_AMOUNT, '\n', day, flags=re.I)
+                day = re.sub(REGEX_EACH, '\n', day, flags=re.I)
+                day = day.split('\n')
+                day = list(map(str.strip, day))
+                day = list(filter(None, day))
+                day = list(map(lambda x: x.lower().capitalize().replace('ocado', 'Ocado').replace('m&s', 'M&S').replace('M&s', 'M&S'), day))
+                day = list(map(capitalise, day))
+                updated_bbd_lists = updated_bbd_lists + [day]
+            else:
+                updated_bbd_lists = updated_bbd_lists + [[]]
+        return updated_bbd_lists
+
+    fridge_index = header_index("Fridge")
+    cupboard_index = header_index("Cupboard")
+    end_index = find_end_index()
+    fridge = update_bbds(fridge_index, cupboard_index - 2) # type: ignore
+    cupboard = update_bbds(cupboard_index, end_index)
+    return [fridge_day + cupboard_day for fridge_day, cupboard_day in zip(fridge[:7], cupboard[:7])]
+
+
+def main() -> None:
+    receipt_list = build_receipt()
+    ocado_email = OcadoEmail(1, "receipt", None, None, None, None, "1001")
+    receipt = receipt_parse(ocado_email, receipt_list)
+    assert [list(day) for day in receipt.bbds] == legacy_parse(receipt_list)
+    assert None not in receipt.prices
+    legacy = min(timeit.repeat(lambda: legacy_parse(receipt_list), number=NUMBER, repeat=REPEAT)) / NUMBER
+    single = min(timeit.repeat(lambda: receipt_parse(ocado_email, receipt_list), number=NUMBER, repeat=REPEAT)) / NUMBER
+    print(f"{ITEMS} item receipt, {len(receipt_list)} lines, best of {REPEAT}")
+    print(f"  index scans + update_bbds:   {legacy * 1000:8.2f} ms")
+    print(f"  single pass line items:      {single * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Micro-benchmark for parsing Ocado confirmation emails.
+
+Compares the compiled extractor in order_parse with the previous approach of one regex search per field
+followed by strptime, over a corpus built from tests/fixtures/basic.eml.
+
+Run from the repository root with: python -m benchmarks.bench_confirmation
+"""
+
+from datetime import datetime
+from email import message_from_bytes
+from email.policy import default as default_policy
+from pathlib import Path
+import re
+import timeit
+
+from custom_components.ocado.const import (
+    REGEX_DATE,
+    REGEX_DAY_FULL,
+    REGEX_MONTH_FULL,
+    REGEX_ORDINALS,
+    REGEX_TIME,
+    REGEX_YEAR,
+    OcadoEmail,
+)
+from custom_components.ocado.utils import order_parse
+
+FIXTURE = Path(__file__).parent.parent / "tests" / "fixtures" / "basic.eml"
+CORPUS_SIZE = 1000
+REPEAT = 5
+
+
+def build_corpus() -> list[OcadoEmail]:
+    """Vary the order number, slot and deadline so nothing is served from a cache."""
+    message = message_from_bytes(FIXTURE.read_bytes(), policy=default_policy)
+    body = message.get_body(preferencelist=("plain",)).get_content() # type: ignore
+    corpus = []
+    for i in range(CORPUS_SIZE):
+        day = i % 28 + 1
+        text = (
+            body.replace("Sunday 22 June", f"Sunday {day} June 2025")
+            .replace("1234567891", str(1000000000 + i))
+            .replace("10:00am and 11:00am", f"{i % 12 + 1}:00pm and {(i + 1) % 12 + 1}:00pm")
+        )
+        corpus.append(OcadoEmail(i, "confirmation", None, None, None, text, None))
+    return corpus
+
+
+def legacy_parse(message: str) -> tuple:
+    """The per-field searches order_parse used to run."""
+    pattern = fr"Delivery\sdate:\s+(?:{REGEX_DAY_FULL}\s)?(?P<day>{REGEX_DATE})\s(?P<month>{REGEX_MONTH_FULL})\s(?P<year>{REGEX_YEAR})"
+    raw = re.search(pattern, message)
+    year, month, day = raw.group("year"), raw.group("month"), raw.group("day") # type: ignore
+    pattern = fr"Delivery\stime:\s+(?:Between\s)?(?P<start>{REGEX_TIME})\sand\s(?P<end>{REGEX_TIME})"
+    raw = re.search(pattern, message)
+    start = re.sub(r"pm", r"PM", re.sub(r"am", r"AM", raw.group("start"))) # type: ignore
+    end = re.sub(r"pm", r"PM", re.sub(r"am", r"AM", raw.group("end"))) # type: ignore
+    delivery = datetime.strptime(f"{year}-{month}-{day} {start}", "%Y-%B-%d %I:%M%p")
+    window_end = datetime.strptime(f"{year}-{month}-{day} {end}", "%Y-%B-%d %I:%M%p")
+    pattern = fr"(?:You\scan\sedit\sthis\sorder\suntil:?\s)(?P<time>{REGEX_TIME})(?:\son|,)\s(?P<day>{REGEX_DATE})(?:{REGEX_ORDINALS})?\s(?P<month>{REGEX_MONTH_FULL})\s(?P<year>{REGEX_YEAR})"
+    raw = re.search(pattern, message)
+    edit = datetime.strptime(f"{raw.group('year')}-{raw.group('month')}-{raw.group('day')} {raw.group('time')}", "%Y-%B-%d %H:%M") # type: ignore
+    total = re.search(r"Total\s\(estimated\):\s{1,20}(?P<total>\d+.\d{2})\sGBP", message).group("total") # type: ignore
+    order_number = re.search(r"(?:[Oo]rder\s(?:ref(?:\.|erence):|no:|is)?(?:\s+)?)(?:<strong>)?(?P<order_number>\d+)", message).group("order_number") # type: ignore
+    return order_number, delivery, window_end, edit, total
+
+
+def main() -> None:
+    corpus = build_corpus()
+    bodies = [email.body for email in corpus]
+    legacy = min(timeit.repeat(lambda: [legacy_parse(body) for body in bodies], number=1, repeat=REPEAT)) # type: ignore
+    single = min(timeit.repeat(lambda: [order_parse(email) for email in corpus], number=1, repeat=REPEAT))
+    print(f"{CORPUS_SIZE} confirmations, best of {REPEAT}")
+    print(f"  per-field search + strptime: {legacy * 1000:8.1f} ms  {CORPUS_SIZE / legacy:9.0f} emails/s")
+    print(f"  compiled extractor:          {single * 1000:8.1f} ms  {CORPUS_SIZE / single:9.0f} emails/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Micro-benchmark for parsing email Date headers.
+
+Compares get_email_from_datetime, which tries the RFC 5322 parser first, with the previous fuzzy dateutil parse of
+every header, over a corpus of generated headers in the formats mail servers send.
+
+Run from the repository root with: python -m benchmarks.bench_dates
+"""
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import timeit
+
+from dateutil.parser import parse
+
+from custom_components.ocado.utils import get_email_from_datetime
+
+CORPUS_SIZE = 5000
+REPEAT = 5
+ZONES = [timezone.utc, timezone(timedelta(hours=1)), timezone(timedelta(hours=-5))]
+
+
+def build_corpus() -> list[str]:
+    """Spread the headers over a year and a few offsets, with the odd trailing zone comment."""
+    start = datetime(2025, 1, 1, 6, 0)
+    corpus = []
+    for i in range(CORPUS_SIZE):
+        sent = (start + timedelta(hours=i * 7, minutes=i % 60)).replace(tzinfo=ZONES[i % len(ZONES)])
+        header = format_datetime(sent)
+        if i % 5 == 0:
+            header += " (UTC)" if sent.utcoffset() == timedelta(0) else " (BST)"
+        corpus.append(header)
+    return corpus
+
+
+def main() -> None:
+    corpus = build_corpus()
+    for header in corpus:
+        assert get_email_from_datetime(header) == parse(header, fuzzy=True, dayfirst=True), header
+    fuzzy = min(timeit.repeat(lambda: [parse(header, fuzzy=True, dayfirst=True) for header in corpus], number=1, repeat=REPEAT))
+    fast = min(timeit.repeat(lambda: [get_email_from_datetime(header) for header in corpus], number=1, repeat=REPEAT))
+    print(f"{CORPUS_SIZE} Date headers, best of {REPEAT}")
+    print(f"  fuzzy dateutil parse:        {fuzzy * 1000:8.1f} ms  {CORPUS_SIZE / fuzzy:9.0f} headers/s")
+    print(f"  RFC 5322 fast path:          {fast * 1000:8.1f} ms  {CORPUS_SIZE / fast:9.0f} headers/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Memory benchmark for the email, order and receipt records.
+
+Builds a year of weekly orders, each with its confirmation email, order and receipt, once with the previous
+dict-backed classes and once with the slotted records in const.py, and compares the memory they hold. The old
+receipts only had the item names, so the slotted ones are measured both with the names alone and with the parallel
+quantity and price columns receipts are now parsed into.
+
+Run from the repository root with: python -m benchmarks.bench_models
+"""
+
+from dataclasses import replace
+from datetime import date, datetime, timedelta, timezone
+import gc
+import tracemalloc
+
+from custom_components.ocado.const import RECEIPT_COLUMNS, OcadoEmail, OcadoOrder, OcadoReceipt
+
+WEEKS = 52
+ITEMS_PER_DAY = 8
+
+
+class LegacyEmail:
+    def __init__(self, message_id, email_type, date, from_address, subject, body, order_number):
+        self.message_id     = message_id
+        self.type           = email_type
+        self.date           = date
+        self.from_address   = from_address
+        self.subject        = subject
+        self.body           = body
+        self.order_number   = order_number
+
+
+class LegacyOrder:
+    def __init__(self, updated, order_number, delivery_datetime, delivery_window_end, edit_datetime, estimated_total):
+        self.updated                = updated
+        self.order_number           = order_number
+        self.delivery_datetime      = delivery_datetime
+        self.delivery_window_end    = delivery_window_end
+        self.edit_datetime          = edit_datetime
+        self.estimated_total        = estimated_total
+
+
+class LegacyReceipt:
+    def __init__(self, updated, order_number, mon, tue, wed, thu, fri, sat, sun, date_dict):
+        self.updated        = updated
+        self.order_number   = order_number
+        self.mon            = mon
+        self.tue            = tue
+        self.wed            = wed
+        self.thu            = thu
+        self.fri            = fri
+        self.sat            = sat
+        self.sun            = sun
+        self.date_dict      = date_dict
+
+
+def _week(week: int) -> tuple:
+    """Return the shared values for one week's order, so both representations hold the same strings."""
+    delivery = datetime(2025, 1, 5, 10, 0) + timedelta(weeks=week)
+    order_number = str(1000000000 + week)
+    items = [[f"Item {week}-{day}-{i}" for i in range(ITEMS_PER_DAY)] for day in range(7)]
+    dates = [delivery.date() + timedelta(days=offset) for offset in range(1, 8)]
+    return delivery, order_number, items, dates
+
+
+def build_legacy(weeks: list[tuple]) -> list:
+    records = []
+    for week, (delivery, order_number, items, dates) in enumerate(weeks):
+        sent = (delivery - timedelta(days=5)).replace(tzinfo=timezone.utc)
+        records.append(LegacyEmail(week, "confirmation", sent, "noreply@email.ocado.com", "Confirmation of your order", None, order_number))
+        records.append(LegacyOrder(sent, order_number, delivery, delivery + timedelta(hours=1), delivery - timedelta(hours=17), "95.10"))
+        records.append(LegacyReceipt(delivery, order_number, *[list(day) for day in items], {day.weekday(): day for day in dates}))
+    return records
+
+
+def build_slotted(weeks: list[tuple]) -> list:
+    records = []
+    for week, (delivery, order_number, items, dates) in enumerate(weeks):
+        sent = (delivery - timedelta(days=5)).replace(tzinfo=timezone.utc)
+        records.append(OcadoEmail(week, "confirmation", sent, "noreply@email.ocado.com", "Confirmation of your order", None, order_number))
+        records.append(OcadoOrder(sent, order_number, delivery, delivery + timedelta(hours=1), delivery - timedelta(hours=17), "95.10"))
+        by_weekday = sorted(dates, key=date.weekday)
+        records.append(OcadoReceipt(delivery, order_number, tuple(tuple(day) for day in items), tuple(by_weekday)))
+    return records
+
+
+def build_slotted_with_columns(weeks: list[tuple]) -> list:
+    records = build_slotted(weeks)
+    for i in range(2, len(records), 3):
+        # Quantities and prices as parsed
+        count = sum(map(len, records[i].bbds))
+        records[i] = replace(records[i], columns=b"".join(RECEIPT_COLUMNS.pack(1, 1, price, -1) for price in range(300, 300 + count)))
+    return records
+
+
+def measure(build, weeks: list[tuple]) -> int:
+    """Return the bytes still allocated by the records once they're built."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = build(weeks)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return after - before
+
+
+def main() -> None:
+    weeks = [_week(week) for week in range(WEEKS)]
+    legacy = measure(build_legacy, weeks)
+    slotted = measure(build_slotted, weeks)
+    columns = measure(build_slotted_with_columns, weeks)
+    print(f"{WEEKS} weekly orders, {ITEMS_PER_DAY * 7} receipt items each, item strings shared by both")
+    print(f"  dict-backed classes:         {legacy / 1024:8.1f} KiB")
+    print(f"  slotted records:             {slotted / 1024:8.1f} KiB  ({slotted / legacy:.0%})")
+    print(f"  slotted records with prices: {columns / 1024:8.1f} KiB  ({columns / legacy:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,16 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 
-from homeassistant.exceptions import ConfigEntryNotReady
 # from homeassistant.helpers.device_registry import DeviceEntry
-from homeassistant.helpers.update_coordinator import UpdateFailed
 
 from homeassistant.helpers import config_validation as cv, device_registry as dr
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
 # , device_registry as dr
 
-from .const import DOMAIN
+from .const import DOMAIN, STORAGE_KEY, STORAGE_VERSION
 from .coordinator import OcadoUpdateCoordinator
+from .imap_client import IMAP_KEEPALIVE_INTERVAL
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -75,44 +76,50 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
             f"Config entry {config_entry.title} ({config_entry.entry_id}) for {DOMAIN} has already been setup!"
         )
 
-    try:
-        # Setup the coordinator and perform the first refresh
-        coordinator = OcadoUpdateCoordinator(hass, config_entry)
-        _LOGGER.debug("OcadoUpdateCoordinator initialised.")
-        await coordinator.async_config_entry_first_refresh()
-
-        if not coordinator.data:
-            raise ConfigEntryNotReady
-        _LOGGER.info(
-            f"Initial data fetched successfully for entry_id={config_entry.entry_id}"
-        )
-
-        # Store the coordinator
-        _LOGGER.debug("Storing coordinator")
-        hass.data.setdefault(DOMAIN,{})[config_entry.entry_id] = {"coordinator": coordinator}
-
-        _LOGGER.debug(
-            f"Coordinator stored in hass.data under entry_id={config_entry.entry_id}"
-        )
-
-        # Forward the setup to all platforms
-        if "platforms" not in hass.data[DOMAIN][config_entry.entry_id]:
-            _LOGGER.debug(f"Forwarding setup to platforms: {PLATFORMS}")
-            await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
-            hass.data[DOMAIN][config_entry.entry_id]["platforms"] = PLATFORMS
-        _LOGGER.info(
-            f"async_setup_entry finished for entry_id={config_entry.entry_id}"
-        )
-        _LOGGER.debug("Cleaning up old devices.")
-        await cleanup_old_device(hass)
-        _LOGGER.debug("Completed cleaning up old devices.")
-        # config_entry.runtime_data = coordinator
-        # config_entry.async_on_unload(config_entry.add_update_listener(async_update_entry))
-        return True
-    
-    except UpdateFailed as error:
-        _LOGGER.error("Unable to fetch initial data: %s", error)
-        raise ConfigEntryNotReady from error
+    # Setup the coordinator, the first refresh runs in the background once the sensors are up
+    coordinator = OcadoUpdateCoordinator(hass, config_entry)
+    _LOGGER.debug("OcadoUpdateCoordinator initialised.")
+    # Emails parsed before a restart don't need downloading again, and the sensors start from the last snapshot
+    await coordinator.async_load_cache()
+
+    # Store the coordinator
+    _LOGGER.debug("Storing coordinator")
+    hass.data.setdefault(DOMAIN,{})[config_entry.entry_id] = {"coordinator": coordinator}
+
+    _LOGGER.debug(
+        f"Coordinator stored in hass.data under entry_id={config_entry.entry_id}"
+    )
+
+    # Keep the IMAP session alive between polls
+    config_entry.async_on_unload(
+        async_track_time_interval(hass, coordinator.imap_session.async_keepalive, IMAP_KEEPALIVE_INTERVAL)
+    )
+
+    # Stop the sensor update timer with the entry
+    config_entry.async_on_unload(coordinator.async_cancel_transition)
+
+    # Forward the setup to all platforms
+    if "platforms" not in hass.data[DOMAIN][config_entry.entry_id]:
+        _LOGGER.debug(f"Forwarding setup to platforms: {PLATFORMS}")
+        await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
+        hass.data[DOMAIN][config_entry.entry_id]["platforms"] = PLATFORMS
+
+    # A slow IMAP server shouldn't hold up Home Assistant starting
+    config_entry.async_create_background_task(hass, coordinator.async_background_first_refresh(), f"{DOMAIN}_first_refresh")
+
+    # Refresh as soon as the server pushes a change, falling back to polling if it can't
+    if coordinator.imap_idle:
+        config_entry.async_create_background_task(hass, coordinator.async_idle_loop(), f"{DOMAIN}_imap_idle")
+
+    _LOGGER.info(
+        f"async_setup_entry finished for entry_id={config_entry.entry_id}"
+    )
+    _LOGGER.debug("Cleaning up old devices.")
+    await cleanup_old_device(hass)
+    _LOGGER.debug("Completed cleaning up old devices.")
+    # config_entry.runtime_data = coordinator
+    # config_entry.async_on_unload(config_entry.add_update_listener(async_update_entry))
+    return True
 
 
 async def update_listener(hass: HomeAssistant, config_entry: ConfigEntry):
@@ -140,6 +147,10 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
 
         # Clean up resources
         if unload_ok:
+            coordinator = hass.data[DOMAIN][config_entry.entry_id]["coordinator"]
+            await coordinator.imap_session.async_close()
+            # A reload builds a new coordinator, so the cache has to be on disk before it loads it
+            await coordinator.async_flush_cache()
             hass.data[DOMAIN].pop(config_entry.entry_id)
             # If no entries remain, clean up DOMAIN
             if not hass.data[DOMAIN]:
@@ -149,6 +160,11 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
 
     return False
 
+async def async_remove_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
+    """Remove the email cache along with the config entry."""
+    await Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{config_entry.entry_id}").async_remove()
+
+
 async def async_update_entry(hass: HomeAssistant, config_entry: ConfigEntry):
     """Reload Ocado component when options changed."""
     await hass.config_entries.async_reload(config_entry.entry_id)
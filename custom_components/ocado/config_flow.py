@@ -18,15 +18,21 @@ from homeassistant.config_entries import (
 from .const import (
     DOMAIN,
     CONF_IMAP_DAYS,
+    CONF_IMAP_FETCH_BATCH,
     CONF_IMAP_FOLDER,
+    CONF_IMAP_IDLE,
     CONF_IMAP_PORT,
     CONF_IMAP_SERVER,
     DEFAULT_IMAP_DAYS,
+    DEFAULT_IMAP_FETCH_BATCH,
     DEFAULT_IMAP_FOLDER,
+    DEFAULT_IMAP_IDLE,
     DEFAULT_IMAP_PORT,
     DEFAULT_IMAP_SERVER,
     DEFAULT_SCAN_INTERVAL,
+    MAX_IMAP_FETCH_BATCH,
     MIN_IMAP_DAYS,
+    MIN_IMAP_FETCH_BATCH,
     MIN_SCAN_INTERVAL,
 )
 
@@ -278,6 +284,14 @@ class OcadoOptionsFlowHandler(OptionsFlow):
                     CONF_IMAP_DAYS,
                     default=self.options.get(CONF_IMAP_DAYS, DEFAULT_IMAP_DAYS),
                 ): (vol.All(vol.Coerce(int), vol.Clamp(min=MIN_IMAP_DAYS))),
+                vol.Optional(
+                    CONF_IMAP_IDLE,
+                    default=self.options.get(CONF_IMAP_IDLE, DEFAULT_IMAP_IDLE),
+                ): cv.boolean,
+                vol.Optional(
+                    CONF_IMAP_FETCH_BATCH,
+                    default=self.options.get(CONF_IMAP_FETCH_BATCH, DEFAULT_IMAP_FETCH_BATCH),
+                ): (vol.All(vol.Coerce(int), vol.Clamp(min=MIN_IMAP_FETCH_BATCH, max=MAX_IMAP_FETCH_BATCH))),
             }
         )
 
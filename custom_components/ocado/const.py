@@ -1,7 +1,10 @@
 """Constants for the Ocado integration."""
+from dataclasses import dataclass, field, fields
 from datetime import date, datetime, timedelta
 import json
 import re
+import struct
+from typing import ClassVar
 
 DOMAIN = "ocado"
 
@@ -12,6 +15,8 @@ OCADO_CUTOFF_SUBJECT =          "Don't miss the cut-off time for editing your or
 OCADO_NEW_TOTAL_SUBJECT =       "Confirmation of your order changes"
 OCADO_RECEIPT_SUBJECT =         "Your receipt and updates for today’s delivery"
 OCADO_SMARTPASS_SUBJECT =       "Payment successful: Smart Pass membership"
+# Enough to classify an email without downloading its body
+OCADO_HEADER_ITEMS =            "BODY.PEEK[HEADER.FIELDS (SUBJECT DATE FROM)]"
 OCADO_SUBJECT_DICT = {
     OCADO_CANCELLATION_SUBJECT: "cancellation",
     OCADO_CONFIRMATION_SUBJECT: "confirmation",
@@ -20,17 +25,23 @@ OCADO_SUBJECT_DICT = {
 }
 
 CONF_IMAP_DAYS =     'imap_days'
+CONF_IMAP_FETCH_BATCH = 'imap_fetch_batch'
 CONF_IMAP_FOLDER =   'imap_folder'
+CONF_IMAP_IDLE =     'imap_idle'
 CONF_IMAP_PORT =     'imap_port'
 CONF_IMAP_SERVER =   'imap_host'
 CONF_IMAP_SSL =      'imap_ssl'
 
 DEFAULT_IMAP_DAYS =     31
+DEFAULT_IMAP_FETCH_BATCH = 10
 DEFAULT_IMAP_FOLDER =   'INBOX'
+DEFAULT_IMAP_IDLE =     True
 DEFAULT_IMAP_PORT =     993
 DEFAULT_IMAP_SERVER =   'imap.gmail.com'
 DEFAULT_IMAP_SSL =      'ssl'
 DEFAULT_SCAN_INTERVAL = 600
+# Safety net poll while IMAP IDLE is pushing changes
+DEFAULT_IDLE_SCAN_INTERVAL = 3600
 
 DEVICE_CLASS = "ocado_deliveries"
 
@@ -40,8 +51,31 @@ EMAIL_ATTR_BODY = 'body'
 EMAIL_ATTR_DATE = 'date'
 
 MIN_IMAP_DAYS = 7
+MIN_IMAP_FETCH_BATCH = 1
+MAX_IMAP_FETCH_BATCH = 100
+# Only the start of a body is decoded, Ocado's emails are a few tens of KB so this only trims runaway messages
+MAX_BODY_BYTES = 512 * 1024
 MIN_SCAN_INTERVAL = 60
 
+# Polling backs off away from the times Ocado emails are expected
+POLL_INTERVAL_NO_ORDERS = timedelta(hours=4)
+POLL_INTERVAL_WAITING = timedelta(hours=1)
+POLL_WINDOW_AFTER_EDIT = timedelta(hours=2)
+POLL_WINDOW_AFTER_DELIVERY = timedelta(hours=2)
+
+# Parsed emails are kept on disk between restarts
+STORAGE_KEY = f"{DOMAIN}_cache"
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 10
+# The first refresh after a restart is spread over this many seconds when there's a snapshot to show meanwhile
+STARTUP_REFRESH_JITTER = 30
+MAX_CACHED_EMAILS = 500
+# Text extracted from receipt PDFs, keyed by a hash of the PDF, a receipt is only ever extracted once
+MAX_CACHED_PDFS = 8
+# Receipts are parsed in a worker process that is killed past these limits
+RECEIPT_WORKER_TIMEOUT = 60
+RECEIPT_WORKER_MEMORY = 512 * 1024 * 1024
+
 REGEX_DATE = r"3[01]|[12][0-9]|0?[1-9]"
 REGEX_DAY_FULL = r"Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday"
 REGEX_DAY_SHORT = r"Mon|Tue|Wed|Thu|Fri|Sat|Sun"
@@ -49,14 +83,15 @@ REGEX_MONTH_FULL = r"January|February|March|April|May|June|July|August|September
 REGEX_MONTH_SHORT = r"Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec"
 REGEX_MONTH = r"1[0-2]|0?[1-9]"
 REGEX_YEAR = r"(?:19|20)\d{2}"
+MONTHS = {month: number for number, month in enumerate(REGEX_MONTH_FULL.split("|"), 1)}
 # If this eventually fails due to other formats being used, python-dateutil should be used
 REGEX_DATE_FULL = r"((?:" + REGEX_DATE + r")\/(?:" + REGEX_MONTH + r")\/(?:" + REGEX_YEAR + r"))"
 REGEX_TIME = r"([01]?[0-9]|2[0-3])(:|.)([0-5][0-9])\s*([AaPp][Mm])?"
 REGEX_ORDINALS = r"st|nd|rd|th"
 
 REGEX_AMOUNT = r"(?:\d+x)?\d+k?(?:g|l|ml)"
-REGEX_COLUMNS = r"\s?\d+\/\d+\s?\d+.\d{2}\*?"
-REGEX_EACH = r"\((?:£|\\u00a3)\d+\.\d{2}\/\s?each\)"
+REGEX_COLUMNS = r"\s?(?P<delivered>\d+)\/(?P<ordered>\d+)\s?(?P<price>\d+.\d{2})\*?"
+REGEX_EACH = r"\((?:£|\\u00a3)(?P<each_price>\d+\.\d{2})\/\s?each\)"
 
 STRING_PLUS = "Products with a 'use-by' date over one week"
 STRING_NO_BBD = "Products with no 'use-by' date" # only applicable to cupboard
@@ -65,6 +100,47 @@ STRING_FREEZER = 'Freezer'
 STRING_PREFIX = 'Use by end of '
 STRING_HEADER = ["Delivered /", "Ordered", "Price", "to", "pay", "(£)"]
 
+
+def _time_pattern(name: str) -> str:
+    """Return a time pattern with its hour, minute and am/pm captured under the given name."""
+    return fr"(?P<{name}_hour>[01]?[0-9]|2[0-3])(?::|.)(?P<{name}_minute>[0-5][0-9])\s*(?P<{name}_ampm>[AaPp][Mm])?"
+
+
+REGEX_ORDER_NUMBER = r"(?:[Oo]rder\s(?:ref(?:\.|erence):|no:|is)?(?:\s+)?)(?:<strong>)?(?P<order_number>\d+)"
+
+# Every pattern the parsers use, compiled once at import and grouped by the kind of email it reads.
+# Support for a new email type adds its group here, the parsers only ever look patterns up.
+PATTERNS: dict[str, dict[str, re.Pattern]] = {
+    "common": {
+        "order_number"      : re.compile(REGEX_ORDER_NUMBER),
+    },
+    "confirmation": {
+        "delivery_date"     : re.compile(fr"Delivery\sdate:\s+(?:{REGEX_DAY_FULL}\s)?(?P<delivery_day>{REGEX_DATE})\s(?P<delivery_month>{REGEX_MONTH_FULL})\s(?P<delivery_year>{REGEX_YEAR})"),
+        "delivery_time"     : re.compile(fr"Delivery\stime:\s+(?:Between\s)?{_time_pattern('start')}\sand\s{_time_pattern('end')}"),
+        "edit_datetime"     : re.compile(fr"You\scan\sedit\sthis\sorder\suntil:?\s{_time_pattern('edit')}(?:\son|,)\s(?P<edit_day>{REGEX_DATE})(?:{REGEX_ORDINALS})?\s(?P<edit_month>{REGEX_MONTH_FULL})\s(?P<edit_year>{REGEX_YEAR})"),
+        "estimated_total"   : re.compile(r"Total\s\(estimated\):\s{1,20}(?P<total>\d+.\d{2})\sGBP"),
+        "order_number"      : re.compile(REGEX_ORDER_NUMBER),
+    },
+    "new_total": {
+        "total"             : re.compile(r"New\sorder\stotal:\s{1,20}(?P<total>\d+.\d{1,2})\sGBP"),
+    },
+    "receipt": {
+        "date"              : re.compile(REGEX_DATE_FULL),
+        # The columns, amount and each price trailing an item, matched in one go with the most complete first.
+        # The lookahead lets the scan skip the letters of item names without trying each alternative.
+        "cleanup"           : re.compile(fr"(?=[\s\d(])(?:{REGEX_COLUMNS}|{REGEX_AMOUNT}|{REGEX_EACH})", re.I),
+        "end_index"         : re.compile(REGEX_END_INDEX),
+    },
+}
+# The label each confirmation field starts with, so its pattern can be matched where the label is found
+CONFIRMATION_LABELS = {
+    "delivery_date"     : "Delivery date:",
+    "delivery_time"     : "Delivery time:",
+    "edit_datetime"     : "You can edit this order until",
+    "estimated_total"   : "Total (estimated):",
+    "order_number"      : "Order ref.:",
+}
+
 DAYS = [
     "mon",
     "tue",
@@ -105,90 +181,174 @@ EMPTY_ATTRIBUTES = {
     "estimated_total"       : None,
 }
 
+# The records below are frozen and slotted: they're small, compare and hash by value, and can be shared safely
+
+
+@dataclass(frozen=True, slots=True)
 class OcadoEmail:
-    """Class for retrieved emails."""
-    def __init__(self,
-        message_id          : bytes | None,
-        email_type          : str   | None,
-        date                : date  | None,
-        from_address        : str   | None,
-        subject             : str   | None,
-        body                : str   | None,
-        order_number        : str   | None,
-    ):
-        self.message_id     = message_id
-        self.type           = email_type
-        self.date           = date
-        self.from_address   = from_address
-        self.subject        = subject
-        self.body           = body
-        self.order_number   = order_number
+    """Class for retrieved emails, unreadable ones couldn't be parsed and aren't fetched again."""
+    message_id          : int       | None
+    type                : str       | None
+    date                : datetime  | None
+    from_address        : str       | None
+    subject             : str       | None
+    body                : str       | None
+    order_number        : str       | None
+    unreadable          : bool      = False
+    def as_dict(self) -> dict:
+        return {
+            "message_id"    : self.message_id,
+            "type"          : self.type,
+            "date"          : self.date.isoformat() if self.date is not None else None,
+            "from_address"  : self.from_address,
+            "subject"       : self.subject,
+            "order_number"  : self.order_number,
+            "unreadable"    : self.unreadable,
+        }
+    @classmethod
+    def from_dict(cls, data: dict) -> "OcadoEmail":
+        return cls(
+            message_id      = data["message_id"],
+            type            = data["type"],
+            date            = datetime.fromisoformat(data["date"]) if data["date"] is not None else None,
+            from_address    = data["from_address"],
+            subject         = data["subject"],
+            # Bodies are dropped once parsed, so they're never cached
+            body            = None,
+            order_number    = data["order_number"],
+            unreadable      = data["unreadable"],
+        )
+
+NO_BBDS: tuple[tuple[str, ...], ...] = ((),) * 7
+# A receipt item's delivered and ordered quantities, price and each price in pence, -1 where the receipt had none
+RECEIPT_COLUMNS = struct.Struct("<hhii")
 
+@dataclass(frozen=True, slots=True)
+class OcadoReceiptItem:
+    """Class for a line item of an Ocado receipt, as looked up from an OcadoReceipt.
+
+    day is the weekday to use the item by, Monday is 0, or 7 for items with a use-by date over a week away. Prices
+    are in pence, and the quantities and prices are None when the receipt line had no columns to read them from.
+    """
+    name                        : str
+    day                         : int
+    delivered                   : int | None
+    ordered                     : int | None
+    price                       : int | None
+    each_price                  : int | None
+
+@dataclass(frozen=True, slots=True)
 class OcadoReceipt:
-    """Class for Ocado Receipts."""
-    def __init__(self,
-        updated                     : datetime  | date | None,
-        order_number                : str       | None,
-        mon                         : list[str] | None  = [],
-        tue                         : list[str] | None  = [],
-        wed                         : list[str] | None  = [],
-        thu                         : list[str] | None  = [],
-        fri                         : list[str] | None  = [],
-        sat                         : list[str] | None  = [],
-        sun                         : list[str] | None  = [],
-        date_dict                   : dict      | None  = {},
-    ):
-        self.updated                = updated
-        self.order_number           = order_number
-        self.mon                    = mon
-        self.tue                    = tue
-        self.wed                    = wed
-        self.thu                    = thu
-        self.fri                    = fri
-        self.sat                    = sat
-        self.sun                    = sun
-        self.date_dict              = date_dict
+    """Class for Ocado Receipts.
+
+    bbds and dates are indexed by weekday, Monday is 0, giving the names of the items to use by that day and its
+    date, and longer names the items with a use-by date over a week away. A receipt that couldn't be read has no
+    dates. The quantities and prices of the items are packed into columns, and read back a column at a time or by
+    looking an item up by name.
+    """
+    updated                     : datetime  | date | None
+    order_number                : str       | None
+    bbds                        : tuple[tuple[str, ...], ...]   = NO_BBDS
+    dates                       : tuple[date, ...]              = ()
+    longer                      : tuple[str, ...]               = ()
+    # Packed with RECEIPT_COLUMNS, an entry for each item in the order of bbds followed by longer
+    columns                     : bytes                         = b""
+    # The day and position of each item by name, built the first time an item is looked up
+    _index                      : dict[str, tuple[int, int]] | None = field(default=None, init=False, repr=False, compare=False)
+    def _column(self, column: int) -> tuple[int | None, ...]:
+        return tuple(None if row[column] == -1 else row[column] for row in RECEIPT_COLUMNS.iter_unpack(self.columns))
+    @property
+    def delivered(self) -> tuple[int | None, ...]:
+        return self._column(0)
+    @property
+    def ordered(self) -> tuple[int | None, ...]:
+        return self._column(1)
+    @property
+    def prices(self) -> tuple[int | None, ...]:
+        return self._column(2)
+    @property
+    def each_prices(self) -> tuple[int | None, ...]:
+        return self._column(3)
+    def item(self, name: str) -> OcadoReceiptItem | None:
+        """Return the first line item with the given name."""
+        if self._index is None:
+            index = {}
+            position = 0
+            for day, names in enumerate((*self.bbds, self.longer)):
+                for item_name in names:
+                    index.setdefault(item_name, (day, position))
+                    position += 1
+            object.__setattr__(self, "_index", index)
+        found = self._index.get(name) # type: ignore
+        if found is None:
+            return None
+        day, position = found
+        row = RECEIPT_COLUMNS.unpack_from(self.columns, position * RECEIPT_COLUMNS.size)
+        return OcadoReceiptItem(name, day, *(None if value == -1 else value for value in row))
+    def as_dict(self) -> dict:
+        receipt: dict = {day: list(bbds) for day, bbds in zip(DAYS, self.bbds)}
+        receipt["updated"] = self.updated.isoformat() if self.updated is not None else None
+        receipt["order_number"] = self.order_number
+        receipt["date_dict"] = {weekday: day.isoformat() for weekday, day in enumerate(self.dates)}
+        receipt["longer"] = list(self.longer)
+        receipt["columns"] = self.columns.hex()
+        return receipt
+    @classmethod
+    def from_dict(cls, data: dict) -> "OcadoReceipt":
+        date_dict = {int(weekday): date.fromisoformat(day) for weekday, day in data["date_dict"].items()}
+        return cls(
+            updated         = datetime.fromisoformat(data["updated"]) if data["updated"] is not None else None,
+            order_number    = data["order_number"],
+            bbds            = tuple(tuple(data[day]) for day in DAYS[:-1]),
+            dates           = tuple(date_dict[weekday] for weekday in range(7)) if date_dict else (),
+            longer          = tuple(data["longer"]),
+            columns         = bytes.fromhex(data["columns"]),
+        )
     def toJSON(self):
         order = {}
-        for k, v in vars(self).items():
-            order[k] = str(v)
+        for attr in fields(self):
+            if not attr.name.startswith("_"):
+                order[attr.name] = str(getattr(self, attr.name))
         return json.dumps(order)
 
+@dataclass(slots=True)
 class OcadoEmails:
-    """Class for all retrieved emails."""
-    def __init__(self,
-        orders              : list[str],
-        cancelled           : list[OcadoEmail],
-        confirmations       : list[OcadoEmail],
-        total               : OcadoEmail | None,
-        receipt             : OcadoReceipt | None,
-    ):
-        self.orders         = orders
-        self.cancelled      = cancelled
-        self.confirmations  = confirmations
-        self.total          = total
-        self.receipt        = receipt
+    """Class for all retrieved emails, reduced to the orders and receipt the sensors need."""
+    orders              : list[str]
+    cancelled           : list[str]
+    confirmations       : list["OcadoOrder"]
+    total               : "OcadoOrder | None"
+    receipt             : OcadoReceipt | None
 
+@dataclass(frozen=True, slots=True)
 class OcadoOrder:
     """Class for Ocado orders."""
-    def __init__(self,
-        updated                     : datetime | date | None,
-        order_number                : str      | None,
-        delivery_datetime           : datetime | None,
-        delivery_window_end         : datetime | None,
-        edit_datetime               : datetime | None,
-        estimated_total             : str      | None,
-    ):
-        self.updated                = updated
-        self.order_number           = order_number
-        self.delivery_datetime      = delivery_datetime
-        self.delivery_window_end    = delivery_window_end
-        self.edit_datetime          = edit_datetime
-        self.estimated_total        = estimated_total
+    updated                     : datetime | date | None
+    order_number                : str      | None
+    delivery_datetime           : datetime | None
+    delivery_window_end         : datetime | None
+    edit_datetime               : datetime | None
+    estimated_total             : str      | None
+    def as_dict(self) -> dict:
+        order = {}
+        for attr in fields(self):
+            value = getattr(self, attr.name)
+            order[attr.name] = value.isoformat() if isinstance(value, date) else value
+        return order
+    @classmethod
+    def from_dict(cls, data: dict) -> "OcadoOrder":
+        return cls(
+            updated                 = datetime.fromisoformat(data["updated"]) if data["updated"] is not None else None,
+            order_number            = data["order_number"],
+            delivery_datetime       = datetime.fromisoformat(data["delivery_datetime"]) if data["delivery_datetime"] is not None else None,
+            delivery_window_end     = datetime.fromisoformat(data["delivery_window_end"]) if data["delivery_window_end"] is not None else None,
+            edit_datetime           = datetime.fromisoformat(data["edit_datetime"]) if data["edit_datetime"] is not None else None,
+            estimated_total         = data["estimated_total"],
+        )
     def toJSON(self):
         order = {}
-        for k, v in vars(self).items():
-            order[k] = str(v)
+        for attr in fields(self):
+            order[attr.name] = str(getattr(self, attr.name))
         return json.dumps(order)
 
 EMPTY_ORDER = OcadoOrder(
@@ -200,116 +360,131 @@ EMPTY_ORDER = OcadoOrder(
         estimated_total     = None,
     )
 
-def capitalise(text):
-    return text[0].upper() + text[1:]
-
 class BBDLists:
-    """Class for a collection of BBD lists"""
-    days_list               = DAYS[:-1]
-    long_days_list          = LONG_DAYS
-    header_string           = STRING_HEADER
+    """Single pass parser for the use-by sections of a receipt, fed a line at a time.
+
+    Feeding only files each line under its section, the lines are read into items per day once, in finish().
+    """
+    sections                = ("Fridge", "Cupboard")
+    day_index               : ClassVar[dict[str, int]] = {day: weekday for weekday, day in enumerate(LONG_DAYS)}
+    header_strings          = frozenset(STRING_HEADER)
     plus_string             = STRING_PLUS
-    regex_date              = REGEX_DATE_FULL
-    columns_regex           = REGEX_COLUMNS
-    complete_columns_regex  = r"^" + columns_regex + r"$"
-    amount_regex            = REGEX_AMOUNT
-    each_regex              = REGEX_EACH
-    def __init__(self,
-        index_start         : int  | None,
-        index_end           : int  | None,
-        delivery_date       : date | None,
-        date_dict           : dict | None   = {},
-        mon                 : list[str]     = [],
-        tue                 : list[str]     = [],
-        wed                 : list[str]     = [],
-        thu                 : list[str]     = [],
-        fri                 : list[str]     = [],
-        sat                 : list[str]     = [],
-        sun                 : list[str]     = [],
-        plus                : list[str]     = [],
-    ):
-        self.index_start    = index_start
-        self.index_end      = index_end
-        self.delivery_date  = delivery_date
-        self.date_dict      = date_dict
-        self.mon            = mon
-        self.tue            = tue
-        self.wed            = wed
-        self.thu            = thu
-        self.fri            = fri
-        self.sat            = sat
-        self.sun            = sun
-        self.plus           = plus
-    
-    def update_bbds(self, receipt_list: list):
-        if self.index_start is None or self.index_end is None:
-            raise ValueError
-        delivery_date_raw = re.search(self.regex_date, receipt_list[6])
-        if delivery_date_raw is not None:
-            delivery_date_raw = delivery_date_raw.group()
-        else:
-            delivery_date_raw = re.search(self.regex_date, receipt_list[7])
-            if delivery_date_raw is not None:
-                delivery_date_raw = delivery_date_raw.group()
-        if delivery_date_raw is None:
-            raise Exception
-        try:
-            delivery_date = datetime.strptime(delivery_date_raw,"%d/%m/%Y").date()
-        except ValueError:
-            raise ValueError("No date retrieved from receipt_list. Last attempt was with %s", delivery_date_raw)
-        self.delivery_date = delivery_date
-        # We also need to include the dates for the bbds, ideally this would be external, but oh well.
-        date_dict = dict()
-        # Using the delivery date create the day<->date dict
-        for i in range(1, 8):
-            date_dict[(delivery_date + timedelta(days=i)).weekday()] = (delivery_date + timedelta(days=i))
-        tomorrow = self.long_days_list[(delivery_date + timedelta(days=1)).weekday()]
-        self.date_dict = date_dict
-        reduced_list = receipt_list[self.index_start + 1:self.index_end]
-        # The first day has a prefix so we remove it
-        first_day = reduced_list[0].split(' ')[-1]
+    end_strings             = frozenset((STRING_NO_BBD, STRING_FREEZER))
+    regex_date              = PATTERNS["receipt"]["date"]
+    cleanup_regex           = PATTERNS["receipt"]["cleanup"]
+    end_regex               = PATTERNS["receipt"]["end_index"]
+    __slots__ = ("_line_count", "_lines", "_section", "bbds", "columns", "dates", "delivery_date", "longer")
+    def __init__(self):
+        self.delivery_date  : date | None = None
+        # Indexed by weekday, Monday is 0
+        self.dates          : tuple[date, ...] = ()
+        self.bbds           : list[list[str]] = [[] for _ in range(7)]
+        self.longer         : list[str] = []
+        # The delivered and ordered quantities, prices and each prices of the items, packed with RECEIPT_COLUMNS
+        self.columns        = b""
+        self._line_count    = 0
+        # The raw lines of each section, and those of the one being fed
+        self._lines         : dict[str, list[str]] = {}
+        self._section       : list[str] | None = None
+
+    @classmethod
+    def is_end(cls, line: str) -> bool:
+        """Check if the line ends the BBD sections."""
+        return line in cls.end_strings or cls.end_regex.search(line) is not None
+
+    def feed(self, line: str) -> bool:
+        """Take the next line of the receipt, returning False once the end of the BBD sections has been reached."""
+        if self.delivery_date is None:
+            self._line_count += 1
+            if self._line_count in (7, 8):
+                delivery_date_raw = self.regex_date.search(line)
+                if delivery_date_raw is not None:
+                    try:
+                        self.delivery_date = datetime.strptime(delivery_date_raw.group(), "%d/%m/%Y").date()
+                    except ValueError:
+                        raise ValueError("No date retrieved from receipt_list. Last attempt was with %s", delivery_date_raw.group())
+        if line in self.end_strings or self.end_regex.search(line) is not None:
+            return False
+        if line in self.sections:
+            # Headers are repeated at the top of each page a section spills onto
+            if line not in self._lines:
+                # The two lines before the Cupboard header are the foot of the Fridge section rather than items
+                if line == "Cupboard" and self._section is not None:
+                    del self._section[-2:]
+                self._section = self._lines[line] = []
+        elif self._section is not None:
+            self._section.append(line)
+        return True
+
+    def _days(self, lines: list[str], days: list[list[str]]):
+        """File the raw lines of a section under the day they're to be used by, 7 for the plus list."""
+        if not lines:
+            return
+        # The first day has a prefix so we take the last word
+        first_day = lines[0].split(' ')[-1]
         # convert tomorrow into an actual day
         if first_day == "tomorrow":
-            first_day = tomorrow
-        bbd_lists = [[] for _ in range(8)]
-        active_index = self.long_days_list.index(first_day) # type: ignore
-        # Loop over the relevant lines in the list
-        for i in range(1, len(reduced_list)):
-            line = reduced_list[i]
+            day = (self.delivery_date + timedelta(days=1)).weekday() # type: ignore
+        else:
+            day = self.day_index[first_day]
+        for line in lines[1:]:
             # If the line is a day, we switch to the next bbd
-            if line in self.long_days_list:
-                active_index = self.long_days_list.index(line)
-                continue
-            # This is for the plus list, we use 7 since we use 0-6
-            if line == self.plus_string:
-                active_index = 7
-                continue
-            if line in self.header_string:
-                continue
-            if re.search(self.complete_columns_regex, line, flags = re.I):
+            if line in self.day_index:
+                day = self.day_index[line]
+            elif line == self.plus_string:
+                day = 7
+            # Columns on a line of their own are kept, they're the quantities and price of the item before
+            elif line not in self.header_strings:
+                days[day].append(line)
+
+    def _line_items(self, lines: list[str], rows: list[tuple]):
+        """Recombine the raw lines of a day and add its line items to rows, as (name, delivered, ordered, price, each_price).
+
+        The text between the matches of the cleanup pattern is an item's name, and the each price and columns after
+        it, its quantities and price in pence. An item's columns can be on a line of their own. Quantities and
+        prices the receipt doesn't have are -1, as they're packed.
+        """
+        if not lines:
+            return
+        # Split keeps the groups, so each match leaves its delivered, ordered, price and each price after the text before it
+        parts = self.cleanup_regex.split(' '.join(lines))
+        name = None
+        each_price = -1
+        for i in range(0, len(parts) - 1, 5):
+            piece = parts[i].strip()
+            if piece:
+                if name is not None:
+                    rows.append((name, -1, -1, -1, each_price))
+                name = piece.lower().capitalize().replace('ocado', 'Ocado').replace('m&s', 'M&S').replace('M&s', 'M&S')
+                each_price = -1
+            if name is None:
                 continue
-            bbd_lists[active_index].append(line)
-        # There's probably a better and more efficient way of doing this
-        updated_bbd_lists = []
-        for day in bbd_lists:
-            if day:
-                # need to recombine and remove the various column bits
-                day = ' '.join(day)            
-                # start with the most complete strings to remove
-                day = re.sub(self.columns_regex, '\n', day, flags = re.I)
-                day = re.sub(self.amount_regex, '\n', day, flags = re.I)
-                day = re.sub(self.each_regex, '\n', day, flags = re.I)
-                day = day.split('\n')
-                # remove any whitespace/newlines
-                day = list(map(str.strip, day))
-                # Now remove any blank entries, some would have been a single space so order is important
-                day = list(filter(None, day))
-                day = list(map(lambda x:x.lower().capitalize().replace('ocado', 'Ocado').replace('m&s', 'M&S').replace('M&s', 'M&S'), day))
-                day = list(map(capitalise, day))
-                updated_bbd_lists = updated_bbd_lists + [day]
-            else:
-                # if there are no items, add an empty list
-                updated_bbd_lists = updated_bbd_lists + [[]]
-        for i in range(7):
-            setattr(self, self.days_list[i].lower(), updated_bbd_lists[i])
-        self.longer = updated_bbd_lists[7]
+            # An amount has none of the groups, prices are read as pence
+            if parts[i + 4] is not None:
+                each_price = int(parts[i + 4][:-3] + parts[i + 4][-2:])
+            elif parts[i + 3] is not None:
+                rows.append((name, int(parts[i + 1]), int(parts[i + 2]), int(parts[i + 3][:-3] + parts[i + 3][-2:]), each_price))
+                name = None
+        if name is not None:
+            rows.append((name, -1, -1, -1, each_price))
+        piece = parts[-1].strip()
+        if piece:
+            rows.append((piece.lower().capitalize().replace('ocado', 'Ocado').replace('m&s', 'M&S').replace('M&s', 'M&S'), -1, -1, -1, -1))
+
+    def finish(self):
+        """Set the dates, the lists and their columns once every line has been fed, Fridge items before Cupboard."""
+        if self.delivery_date is None:
+            raise ValueError("No delivery date found in the receipt")
+        delivery_date = self.delivery_date
+        # The dates of the week after delivery, indexed by weekday
+        self.dates = tuple(delivery_date + timedelta(days=(weekday - delivery_date.weekday() - 1) % 7 + 1) for weekday in range(7))
+        rows = [[] for _ in range(8)]
+        for section in self.sections:
+            days = [[] for _ in range(8)]
+            self._days(self._lines.get(section, []), days)
+            for day_rows, lines in zip(rows, days):
+                self._line_items(lines, day_rows)
+        self.bbds = [[row[0] for row in day_rows] for day_rows in rows[:7]]
+        self.longer = [row[0] for row in rows[7]]
+        # Packed in the order of bbds followed by longer
+        self.columns = b"".join(RECEIPT_COLUMNS.pack(*row[1:]) for day_rows in rows for row in day_rows)
@@ -1,7 +1,10 @@
 """DataUpdateCoordinator for our integration."""
 
-from datetime import datetime, timedelta, timezone
+import asyncio
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta, timezone
 import logging
+import random
 # import json
 
 from homeassistant.config_entries import ConfigEntry
@@ -16,18 +19,45 @@ from .const import (
     CONF_IMAP_PORT,
     CONF_IMAP_FOLDER,
     CONF_IMAP_DAYS,
+    CONF_IMAP_FETCH_BATCH,
+    CONF_IMAP_IDLE,
+    CONF_IMAP_SSL,
+    DEFAULT_IDLE_SCAN_INTERVAL,
     DEFAULT_SCAN_INTERVAL,
-    DEFAULT_IMAP_DAYS
+    DEFAULT_IMAP_DAYS,
+    DEFAULT_IMAP_FETCH_BATCH,
+    DEFAULT_IMAP_IDLE,
+    DEFAULT_IMAP_SSL,
+    MAX_CACHED_EMAILS,
+    STARTUP_REFRESH_JITTER,
+    STORAGE_KEY,
+    STORAGE_SAVE_DELAY,
+    STORAGE_VERSION,
+    OcadoEmail,
+    OcadoOrder,
+    OcadoReceipt,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_time
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
+from .imap_client import (
+    IMAP_IDLE_BACKOFF,
+    OcadoImapSession,
+    abort_connection,
+    connect_to_server,
+    disconnect_from_server,
+    wait_for_folder_change,
+)
 from .utils import (
     email_triage,
-    order_parse,
+    get_next_transition,
+    get_poll_interval,
+    snapshot_from_dict,
+    snapshot_to_dict,
     sort_orders,
     # receipt_parse,
-    total_parse,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -47,10 +77,44 @@ class OcadoUpdateCoordinator(DataUpdateCoordinator):
         self.imap_host      = config_entry.data[CONF_IMAP_SERVER]
         self.imap_port      = config_entry.data[CONF_IMAP_PORT]
         self.imap_folder    = config_entry.data[CONF_IMAP_FOLDER]
+        self.imap_ssl       = config_entry.data.get(CONF_IMAP_SSL, DEFAULT_IMAP_SSL)
                 
         # Set variables from options
         self.scan_interval  = config_entry.options.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)
         self.imap_days      = config_entry.options.get(CONF_IMAP_DAYS, DEFAULT_IMAP_DAYS)
+        self.imap_idle      = config_entry.options.get(CONF_IMAP_IDLE, DEFAULT_IMAP_IDLE)
+        self.imap_fetch_batch = config_entry.options.get(CONF_IMAP_FETCH_BATCH, DEFAULT_IMAP_FETCH_BATCH)
+        self.push_active    = False
+
+        # Parsed emails by UID, so each poll only fetches what's new
+        self.uidvalidity    : int | None = None
+        self.triage_cache   : dict[int, OcadoEmail] = {}
+        self.receipt_cache  : dict[int, OcadoReceipt] = {}
+        # The same receipts by order number, for looking their line items up
+        self.receipts       : dict[str, OcadoReceipt] = {}
+        # Confirmations and new totals are kept as the order they describe, their bodies are dropped once parsed
+        self.order_cache    : dict[int, OcadoOrder] = {}
+        # Receipt PDF text by content hash, least recently used first
+        self.pdf_cache      : OrderedDict[str, list[str]] = OrderedDict()
+        # The last folder probe, when it matches the next one the SEARCH is skipped
+        self.folder_status  : dict[str, int] | None = None
+        self.search_date    : date | None = None
+        self.polls_short_circuited = 0
+        self.poll_times     : deque[datetime] = deque()
+        # Deadlines and deliveries pass without any new email, so the sensors are also updated on a timer
+        self._unsub_transition = None
+        # The parsed emails are persisted, so a restart only fetches what's new
+        self._store         = Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{config_entry.entry_id}")
+
+        # The IMAP session is kept open between polls
+        self.imap_session   = OcadoImapSession(
+            host        = self.imap_host,
+            port        = self.imap_port,
+            email       = self.email_address,
+            password    = self.password,
+            folder      = self.imap_folder,
+            imap_ssl    = self.imap_ssl,
+        )
 
         super().__init__(
             hass,
@@ -62,20 +126,182 @@ class OcadoUpdateCoordinator(DataUpdateCoordinator):
             always_update   = True,
         )
 
+    async def async_load_cache(self) -> None:
+        """Restore the parsed emails and the last sensor data saved by a previous run."""
+        data = await self._store.async_load()
+        if not data:
+            return
+        try:
+            uidvalidity     = data["uidvalidity"]
+            triage_cache    = {int(uid): OcadoEmail.from_dict(email) for uid, email in data["emails"].items()}
+            receipt_cache   = {int(uid): OcadoReceipt.from_dict(receipt) for uid, receipt in data["receipts"].items()}
+            order_cache     = {int(uid): OcadoOrder.from_dict(order) for uid, order in data["orders"].items()}
+            pdf_cache       = OrderedDict((key, list(lines)) for key, lines in data["pdfs"].items())
+            snapshot        = snapshot_from_dict(data["snapshot"]) if data.get("snapshot") else None
+        except (KeyError, TypeError, ValueError) as err:
+            _LOGGER.warning("Ignoring unreadable email cache: %s", err)
+            return
+        self.uidvalidity    = uidvalidity
+        self.triage_cache   = triage_cache
+        self.receipt_cache  = receipt_cache
+        self.order_cache    = order_cache
+        self.pdf_cache      = pdf_cache
+        self._index_receipts()
+        if snapshot is not None:
+            self.data       = snapshot
+            self._update_poll_interval(snapshot)
+            self._schedule_transition(snapshot)
+        _LOGGER.debug(
+            "Restored %s emails, %s orders and %s receipts from the cache", len(self.triage_cache), len(order_cache), len(receipt_cache)
+        )
+
+    async def async_background_first_refresh(self) -> None:
+        """Run the first refresh after setup, staggered when a restored snapshot is already being shown."""
+        if self.data is not None:
+            await asyncio.sleep(random.uniform(0, STARTUP_REFRESH_JITTER))
+        await self.async_refresh()
+
+    @callback
+    def async_save_cache(self) -> None:
+        """Write the parsed emails to disk once things have settled."""
+        self._store.async_delay_save(self._cache_data, STORAGE_SAVE_DELAY)
+
+    async def async_flush_cache(self) -> None:
+        """Write the parsed emails to disk straight away."""
+        await self._store.async_save(self._cache_data())
+
+    def _cache_data(self) -> dict:
+        """Return the newest parsed emails, the triage already forgets anything outside the imap_days window."""
+        uids = sorted(self.triage_cache, reverse=True)[:MAX_CACHED_EMAILS]
+        return {
+            "uidvalidity"   : self.uidvalidity,
+            "emails"        : {uid: self.triage_cache[uid].as_dict() for uid in uids},
+            "receipts"      : {uid: self.receipt_cache[uid].as_dict() for uid in uids if uid in self.receipt_cache},
+            "orders"        : {uid: self.order_cache[uid].as_dict() for uid in uids if uid in self.order_cache},
+            "pdfs"          : dict(self.pdf_cache),
+            "snapshot"      : snapshot_to_dict(self.data) if self.data else None,
+        }
+
+    def _index_receipts(self) -> None:
+        """Key the cached receipts by order number, the newest receipt winning if an order has several."""
+        self.receipts = {
+            self.receipt_cache[uid].order_number: self.receipt_cache[uid] # type: ignore
+            for uid in sorted(self.receipt_cache)
+            if self.receipt_cache[uid].order_number is not None
+        }
+
+    def _set_push_active(self, active: bool) -> None:
+        """Slow polling down to a safety net while IDLE pushes changes, and restore it as soon as IDLE drops."""
+        dropped = self.push_active and not active
+        self.push_active = active
+        self._update_poll_interval(self.data)
+        # A new interval only applies from the next poll, and the one already scheduled could be hours away
+        if dropped and self._listeners and not self.hass.is_stopping:
+            self._schedule_refresh()
+
+    def _update_poll_interval(self, data: dict | None) -> None:
+        """Set the next poll from the orders we know about, IDLE already covers anything sooner."""
+        orders = (data or {}).get("orders") or []
+        interval = get_poll_interval(orders, datetime.now(), timedelta(seconds=self.scan_interval))
+        if self.push_active:
+            interval = max(interval, timedelta(seconds=DEFAULT_IDLE_SCAN_INTERVAL))
+        if interval != self.update_interval:
+            _LOGGER.debug("Polling every %s", interval)
+        self.update_interval = interval
+
+    @callback
+    def _schedule_transition(self, data: dict | None) -> None:
+        """Update the sensors at the next edit deadline, end of a delivery window or midnight."""
+        self.async_cancel_transition()
+        orders = (data or {}).get("orders") or []
+        # Order times are naive local times, the same as the sensors compare them against
+        transition = get_next_transition(orders, datetime.now())
+        self._unsub_transition = async_track_point_in_time(self.hass, self._async_handle_transition, transition.astimezone())
+
+    @callback
+    def _async_handle_transition(self, _now: datetime) -> None:
+        """Work out the next and upcoming orders again from the cached data and tell the sensors, without any I/O."""
+        self._unsub_transition = None
+        if self.data is not None and self.data.get("orders"):
+            self.data["next"], self.data["upcoming"] = sort_orders(list(self.data["orders"]))
+        _LOGGER.debug("Updating the sensors for a passed deadline")
+        self.async_update_listeners()
+        self._schedule_transition(self.data)
+
+    @callback
+    def async_cancel_transition(self) -> None:
+        """Cancel the pending sensor update timer."""
+        if self._unsub_transition is not None:
+            self._unsub_transition()
+            self._unsub_transition = None
+
+    @property
+    def polls_last_day(self) -> int:
+        """Return how many polls ran in the last 24 hours."""
+        self._prune_poll_times(datetime.now(timezone.utc))
+        return len(self.poll_times)
+
+    def _record_poll(self) -> None:
+        """Note the time of a poll, forgetting those more than a day old so the record stays bounded."""
+        now = datetime.now(timezone.utc)
+        self._prune_poll_times(now)
+        self.poll_times.append(now)
+
+    def _prune_poll_times(self, now: datetime) -> None:
+        cutoff = now - timedelta(days=1)
+        while self.poll_times and self.poll_times[0] < cutoff:
+            self.poll_times.popleft()
+
+    async def async_idle_loop(self) -> None:
+        """Hold an IMAP IDLE connection and refresh as soon as the folder changes."""
+        while True:
+            client = None
+            try:
+                # IDLE blocks its connection, so it gets one of its own next to the polling session
+                client = await connect_to_server(
+                    host        = self.imap_host,
+                    port        = self.imap_port,
+                    email       = self.email_address,
+                    password    = self.password,
+                    folder      = self.imap_folder,
+                    imap_ssl    = self.imap_ssl,
+                )
+                if not client.has_capability("IDLE"):
+                    _LOGGER.info("IMAP server does not support IDLE, polling every %s seconds instead", self.scan_interval)
+                    await disconnect_from_server(client)
+                    client = None
+                    return
+                _LOGGER.debug("IMAP IDLE started")
+                self._set_push_active(True)
+                while True:
+                    if await wait_for_folder_change(client):
+                        _LOGGER.debug("IMAP folder changed, requesting a refresh")
+                        await self.async_request_refresh()
+            except Exception as err:  # noqa: BLE001
+                _LOGGER.warning("IMAP IDLE failed, polling until it reconnects: %s", err)
+            finally:
+                self._set_push_active(False)
+                if client is not None:
+                    abort_connection(client)
+            await asyncio.sleep(IMAP_IDLE_BACKOFF)
+
     async def async_update_data(self) -> dict:
         """Fetch data from the IMAP server and filter the emails for Ocado ones."""
         _LOGGER.debug("Beginning coordinator update")
+        self._record_poll()
         try:            
             # Add a way to determine if a BBD is needed -> delivery within 7days?
             # Retrieve all the Ocado order confirmations from the last imap_days, will return None if there are no new emails
-            message_ids, triaged_emails = email_triage(self)
+            message_ids, triaged_emails = await email_triage(self)
+            self._index_receipts()
             if triaged_emails is None:
                 _LOGGER.debug("Returning old state data since no new message_ids")
+                self._update_poll_interval(self.data)
+                self._schedule_transition(self.data)
                 return self.data
-            orders                  = []
-            for order in triaged_emails.confirmations:
-                order = order_parse(order)
-                orders.append(order)
+            self.async_save_cache()
+            # Confirmations were parsed into orders as they were fetched
+            orders                  = list(triaged_emails.confirmations)
             if len(orders) > 0:
                 next, upcoming      = sort_orders(orders)
             else:
@@ -94,11 +320,7 @@ class OcadoUpdateCoordinator(DataUpdateCoordinator):
                 receipt             = None
             # If there has been a recent delivery, add the total.
             if triaged_emails.total is not None:
-                try:
-                    order           = total_parse(triaged_emails.total)
-                    total           = order
-                except: # noqa: E722
-                    total = None
+                total               = triaged_emails.total
             else:
                 _LOGGER.info("No receipt email found.")
                 total               = None
@@ -111,6 +333,8 @@ class OcadoUpdateCoordinator(DataUpdateCoordinator):
                     "receipt"       : receipt,
                     "orders"        : orders,
                 }
+            self._update_poll_interval(payload_raw)
+            self._schedule_transition(payload_raw)
             return payload_raw
         except Exception as err:
             _LOGGER.error("Error fetching data: %s", err)
@@ -0,0 +1,41 @@
+"""Diagnostics support for Ocado UK."""
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_EMAIL, CONF_PASSWORD
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import OcadoUpdateCoordinator
+
+TO_REDACT = {CONF_EMAIL, CONF_PASSWORD}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, config_entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: OcadoUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]["coordinator"]
+    return {
+        "entry": {
+            "data"      : async_redact_data(dict(config_entry.data), TO_REDACT),
+            "options"   : dict(config_entry.options),
+        },
+        "imap": {
+            "push_active"           : coordinator.push_active,
+            "uidvalidity"           : coordinator.uidvalidity,
+            "cached_emails"         : len(coordinator.triage_cache),
+            "cached_receipts"       : len(coordinator.receipt_cache),
+            "receipt_items"         : sum(len(receipt.prices) for receipt in coordinator.receipts.values()),
+            "cached_orders"         : len(coordinator.order_cache),
+            "cached_pdfs"           : len(coordinator.pdf_cache),
+            "folder_status"         : coordinator.folder_status,
+            "polls_short_circuited" : coordinator.polls_short_circuited,
+        },
+        "polling": {
+            "update_interval"       : str(coordinator.update_interval),
+            "polls_last_day"        : coordinator.polls_last_day,
+            # What a fixed scan interval would have cost, for comparison
+            "fixed_polls_per_day"   : round(86400 / coordinator.scan_interval),
+        },
+    }
@@ -0,0 +1,412 @@
+"""Asyncio IMAP client helpers for Ocado UK."""
+import asyncio
+import base64
+from collections.abc import AsyncIterator
+from datetime import timedelta
+import logging
+import quopri
+import re
+
+from aioimaplib import IMAP4, IMAP4_SSL, STOP_WAIT_SERVER_PUSH, Response
+from homeassistant.util.ssl import client_context
+
+from .const import DEFAULT_IMAP_SSL
+
+_LOGGER = logging.getLogger(__name__)
+
+IMAP_TIMEOUT = 30
+IMAP_KEEPALIVE_INTERVAL = timedelta(minutes=10)
+# Servers may drop an IDLE after 30 minutes, so it is restarted just before that
+IMAP_IDLE_TIMEOUT = 29 * 60
+IMAP_IDLE_BACKOFF = 60
+
+REGEX_UIDVALIDITY = re.compile(rb"\[UIDVALIDITY (\d+)\]")
+REGEX_FETCH_UID = re.compile(rb"\bUID (\d+)")
+REGEX_EXISTS = re.compile(rb"^(\d+) EXISTS")
+REGEX_UIDNEXT = re.compile(rb"\[UIDNEXT (\d+)\]")
+REGEX_LITERAL_SIZE = re.compile(rb"\{\d+\}$")
+REGEX_SEXP_TOKEN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+
+async def connect_to_server(
+    host        : str,
+    port        : int,
+    email       : str,
+    password    : str,
+    folder      : str,
+    imap_ssl    : str = DEFAULT_IMAP_SSL,
+) -> IMAP4:
+    """Connect and log in to the IMAP server, then select the folder."""
+    client = await login_to_server(host, port, email, password, imap_ssl)
+    await select_folder(client, folder)
+    return client
+
+
+async def login_to_server(
+    host        : str,
+    port        : int,
+    email       : str,
+    password    : str,
+    imap_ssl    : str = DEFAULT_IMAP_SSL,
+) -> IMAP4:
+    """Connect and log in to the IMAP server."""
+    _LOGGER.debug("Connecting to IMAP server %s:%s", host, port)
+    if imap_ssl == DEFAULT_IMAP_SSL:
+        client = IMAP4_SSL(host=host, port=port, timeout=IMAP_TIMEOUT, ssl_context=client_context())
+    else:
+        client = IMAP4(host=host, port=port, timeout=IMAP_TIMEOUT)
+    await client.wait_hello_from_server()
+    result, _ = await client.login(email, password)
+    if result != "OK":
+        _LOGGER.error("Could not log in to the IMAP server.")
+        raise ConnectionError("Could not log in to the IMAP server.")
+    return client
+
+
+async def select_folder(client: IMAP4, folder: str) -> int | None:
+    """Select the folder and return its UIDVALIDITY."""
+    # aioimaplib only tracks the SELECTED state for SELECT, so messages are fetched with BODY.PEEK to leave them unread
+    result, lines = await client.select(folder)
+    if result != "OK":
+        _LOGGER.error("Could not open the IMAP folder %s.", folder)
+        raise ConnectionError(f"Could not open the IMAP folder {folder}.")
+    for line in lines:
+        if match := REGEX_UIDVALIDITY.search(line):
+            return int(match.group(1))
+    return None
+
+
+async def disconnect_from_server(client: IMAP4) -> None:
+    """Log out, ignoring errors from a dead connection."""
+    # CLOSE is skipped on purpose, it would expunge deleted messages in a read-write folder
+    try:
+        await client.logout()
+    except Exception as err:  # noqa: BLE001
+        _LOGGER.debug("Error while disconnecting from IMAP server: %s", err)
+
+
+def is_connected(client: IMAP4) -> bool:
+    """Check the transport is still open, a NOOP on a closed one would only time out."""
+    transport = getattr(client.protocol, "transport", None)
+    return transport is not None and not transport.is_closing()
+
+
+def abort_connection(client: IMAP4) -> None:
+    """Drop the connection without waiting on a server that may no longer answer."""
+    transport = getattr(client.protocol, "transport", None)
+    if transport is not None:
+        transport.close()
+
+
+class OcadoImapSession:
+    """A long-lived IMAP session that is reused across coordinator polls.
+
+    Use as an async context manager to borrow the selected client. The connection is checked with NOOP before
+    it is handed out and is re-established when it has gone away. If the borrower raises, the connection is
+    dropped so the next poll starts from a fresh login.
+    """
+    def __init__(self,
+        host        : str,
+        port        : int,
+        email       : str,
+        password    : str,
+        folder      : str,
+        imap_ssl    : str = DEFAULT_IMAP_SSL,
+    ):
+        self.host       = host
+        self.port       = port
+        self.email      = email
+        self.password   = password
+        self.folder     = folder
+        self.imap_ssl   = imap_ssl
+        self.uidvalidity: int | None = None
+        self._client    : IMAP4 | None = None
+        self._lock      = asyncio.Lock()
+
+    async def __aenter__(self) -> IMAP4:
+        await self._lock.acquire()
+        try:
+            return await self._async_get_client()
+        except BaseException:
+            self._lock.release()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is not None and self._client is not None:
+                _LOGGER.debug("Dropping IMAP connection after error: %s", exc)
+                abort_connection(self._client)
+                self._client = None
+        finally:
+            self._lock.release()
+
+    async def _async_get_client(self) -> IMAP4:
+        """Return the current client if it still answers NOOP, otherwise reconnect."""
+        if self._client is not None and is_connected(self._client):
+            try:
+                result, _ = await self._client.noop()
+                if result == "OK":
+                    return self._client
+            except Exception as err:  # noqa: BLE001
+                _LOGGER.debug("IMAP connection went stale, reconnecting: %s", err)
+        if self._client is not None:
+            abort_connection(self._client)
+            self._client = None
+        client = await login_to_server(
+            host        = self.host,
+            port        = self.port,
+            email       = self.email,
+            password    = self.password,
+            imap_ssl    = self.imap_ssl,
+        )
+        try:
+            self.uidvalidity = await select_folder(client, self.folder)
+        except Exception:
+            abort_connection(client)
+            raise
+        self._client = client
+        return self._client
+
+    async def async_keepalive(self, *_) -> None:
+        """Send NOOP on an idle connection so the server does not log us out between polls."""
+        if self._client is None or self._lock.locked():
+            return
+        async with self._lock:
+            result = "closed"
+            if is_connected(self._client):
+                try:
+                    result, _ = await self._client.noop()
+                except Exception as err:  # noqa: BLE001
+                    result = str(err)
+            if result != "OK":
+                _LOGGER.debug("IMAP keepalive failed, reconnecting on the next poll: %s", result)
+                abort_connection(self._client)
+                self._client = None
+
+    async def async_close(self) -> None:
+        """Log out and forget the connection."""
+        async with self._lock:
+            if self._client is not None:
+                if is_connected(self._client):
+                    await disconnect_from_server(self._client)
+                self._client = None
+
+
+async def wait_for_folder_change(client: IMAP4, timeout: float = IMAP_IDLE_TIMEOUT) -> bool:
+    """IDLE until the server reports new or removed messages, returns False if the IDLE expired quietly."""
+    idle = await client.idle_start(timeout=timeout)
+    push = await client.wait_server_push()
+    client.idle_done()
+    await asyncio.wait_for(idle, IMAP_TIMEOUT)
+    if push == STOP_WAIT_SERVER_PUSH:
+        return False
+    _LOGGER.debug("IMAP server pushed %s", push)
+    return any(line.endswith((b"EXISTS", b"EXPUNGE")) for line in push)
+
+
+async def probe_folder(client: IMAP4, folder: str) -> dict[str, int] | None:
+    """SELECT the folder again for the counters that move whenever a message arrives or is expunged.
+
+    RFC 3501 and 9051 say STATUS shouldn't be used on the selected folder, and the EXISTS and EXPUNGE responses
+    that would tell us instead are dropped by aioimaplib unless they come with a NOOP. A fresh SELECT reports the
+    same counters in the same single round trip.
+    """
+    # UIDNEXT goes up on every arrival and EXISTS drops on every expunge that isn't covered by one
+    result, lines = await client.select(folder)
+    if result != "OK":
+        _LOGGER.error("Could not open the IMAP folder %s.", folder)
+        raise ConnectionError(f"Could not open the IMAP folder {folder}.")
+    status = {}
+    for line in lines[:-1]:
+        if match := REGEX_EXISTS.match(line):
+            status["EXISTS"] = int(match.group(1))
+        elif match := REGEX_UIDNEXT.search(line):
+            status["UIDNEXT"] = int(match.group(1))
+        elif match := REGEX_UIDVALIDITY.search(line):
+            status["UIDVALIDITY"] = int(match.group(1))
+    return status if len(status) == 3 else None
+
+
+async def search_messages(client: IMAP4, criteria: str) -> list[int]:
+    """Run a UID SEARCH and return the matching UIDs in ascending order."""
+    result, lines = await client.uid_search(criteria, charset=None)
+    if result != "OK":
+        _LOGGER.error("Could not connect to inbox.")
+        raise ConnectionError("Could not connect to inbox.")
+    return sorted(int(uid) for uid in lines[0].split()) if lines else []
+
+
+async def fetch_message(client: IMAP4, uid: int) -> bytes | None:
+    """UID FETCH the full message without setting the seen flag."""
+    response = await client.uid("fetch", str(uid), "(BODY.PEEK[])")
+    if response.result != "OK":
+        _LOGGER.warning("Failed to fetch message %s", uid)
+        return None
+    literals = get_literals(response)
+    if not literals:
+        return None
+    return literals[0]
+
+
+class MessagePart:
+    """A leaf part of a message, as described by its BODYSTRUCTURE."""
+    def __init__(self,
+        section         : str,
+        content_type    : str,
+        charset         : str | None,
+        encoding        : str,
+        size            : int,
+    ):
+        self.section        = section
+        self.content_type   = content_type
+        self.charset        = charset
+        self.encoding       = encoding
+        self.size           = size
+
+    def __repr__(self) -> str:
+        return f"MessagePart({self.section}, {self.content_type}, {self.encoding}, {self.size})"
+
+
+async def fetch_bodystructure(client: IMAP4, uid: int) -> list[MessagePart] | None:
+    """UID FETCH the BODYSTRUCTURE of a message and return its leaf parts."""
+    response = await client.uid("fetch", str(uid), "(UID BODYSTRUCTURE)")
+    if response.result != "OK":
+        _LOGGER.warning("Failed to fetch the structure of message %s", uid)
+        return None
+    # Servers may send awkward strings (filenames mostly) as literals, so splice them back in as quoted strings
+    data = b""
+    for line in response.lines[:-1]:
+        if isinstance(line, bytearray):
+            data += b'"' + bytes(line).replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+        else:
+            data += REGEX_LITERAL_SIZE.sub(b"", line)
+    return parse_bodystructure(data)
+
+
+def parse_bodystructure(data: bytes) -> list[MessagePart] | None:
+    """Parse the BODYSTRUCTURE in a FETCH response line into its leaf parts."""
+    fetch = _parse_sexp(data[data.find(b"("):])
+    for i, item in enumerate(fetch[:-1]):
+        if isinstance(item, str) and item.upper() == "BODYSTRUCTURE" and isinstance(fetch[i + 1], list):
+            return _walk_bodystructure(fetch[i + 1], "")
+    return None
+
+
+def _parse_sexp(data: bytes) -> list:
+    """Parse a parenthesised IMAP list into nested lists of str and None."""
+    stack: list[list] = [[]]
+    for token in REGEX_SEXP_TOKEN.findall(data):
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            if len(stack) > 1:
+                closed = stack.pop()
+                stack[-1].append(closed)
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", token[1:-1]).decode(errors="replace"))
+        else:
+            stack[-1].append(None if token.upper() == b"NIL" else token.decode(errors="replace"))
+    return stack[0][0] if stack[0] and isinstance(stack[0][0], list) else stack[0]
+
+
+def _walk_bodystructure(node: list, section: str) -> list[MessagePart]:
+    """Flatten a BODYSTRUCTURE into its leaf parts, numbering them the way BODY[section] expects."""
+    # A multipart starts with its children, followed by the subtype and extension data
+    if node and isinstance(node[0], list):
+        parts = []
+        for i, child in enumerate(node, 1):
+            if not isinstance(child, list):
+                break
+            parts.extend(_walk_bodystructure(child, f"{section}.{i}" if section else str(i)))
+        return parts
+    params = node[2] if len(node) > 2 and isinstance(node[2], list) else []
+    params = {str(key).lower(): value for key, value in zip(params[::2], params[1::2])}
+    return [MessagePart(
+        section         = section or "1",
+        content_type    = f"{node[0]}/{node[1]}".lower(),
+        charset         = params.get("charset"),
+        encoding        = (node[5] if len(node) > 5 and node[5] else "7bit").lower(),
+        size            = int(node[6]) if len(node) > 6 and node[6] and node[6].isdigit() else 0,
+    )]
+
+
+async def fetch_section(client: IMAP4, uid: int, part: MessagePart) -> bytes | None:
+    """UID FETCH one part of a message and undo its transfer encoding."""
+    response = await client.uid("fetch", str(uid), f"(UID BODY.PEEK[{part.section}])")
+    if response.result != "OK":
+        _LOGGER.warning("Failed to fetch part %s of message %s", part.section, uid)
+        return None
+    literals = get_literals(response)
+    if not literals:
+        return None
+    return decode_transfer_encoding(literals[0], part.encoding)
+
+
+def decode_transfer_encoding(data: bytes, encoding: str) -> bytes:
+    """Decode base64 or quoted-printable data, anything else is passed through untouched."""
+    if encoding == "base64":
+        return base64.b64decode(data)
+    if encoding == "quoted-printable":
+        return quopri.decodestring(data)
+    return data
+
+
+async def fetch_messages(
+    client      : IMAP4,
+    uids        : list[int],
+    batch_size  : int,
+    items       : str = "BODY.PEEK[]",
+) -> AsyncIterator[tuple[int, bytes]]:
+    """UID FETCH the messages in batches, yielding (uid, data) in the order the UIDs were given.
+
+    The next batch is requested while the caller is still working through the current one, so parsing overlaps
+    with the network round trip.
+    """
+    batches = [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+    if not batches:
+        return
+    pending = asyncio.ensure_future(_fetch_batch(client, batches[0], items))
+    try:
+        for i in range(len(batches)):
+            fetched = await pending
+            if i + 1 < len(batches):
+                pending = asyncio.ensure_future(_fetch_batch(client, batches[i + 1], items))
+            for uid in batches[i]:
+                if uid in fetched:
+                    yield uid, fetched.pop(uid)
+    finally:
+        if not pending.done():
+            pending.cancel()
+
+
+async def _fetch_batch(client: IMAP4, uids: list[int], items: str) -> dict[int, bytes]:
+    """UID FETCH one batch and return the literal data keyed by UID."""
+    response = await client.uid("fetch", ",".join(str(uid) for uid in uids), f"(UID {items})")
+    if response.result != "OK":
+        _LOGGER.warning("Failed to fetch messages %s", uids)
+        return {}
+    return parse_fetch_response(response)
+
+
+def parse_fetch_response(response: Response) -> dict[int, bytes]:
+    """Pair each literal in a FETCH response with the UID reported next to it."""
+    fetched = {}
+    lines = response.lines
+    for i, line in enumerate(lines):
+        if not isinstance(line, bytearray):
+            continue
+        # The UID is usually before the literal, but servers may also send it after
+        match = REGEX_FETCH_UID.search(lines[i - 1]) if i > 0 else None
+        if match is None and i + 1 < len(lines) and not isinstance(lines[i + 1], bytearray):
+            match = REGEX_FETCH_UID.search(lines[i + 1])
+        if match is None:
+            _LOGGER.warning("Ignoring FETCH literal without a UID")
+            continue
+        # The literal is handed on as is, a copy would double the memory held for the largest messages
+        fetched[int(match.group(1))] = line
+    return fetched
+
+
+def get_literals(response: Response) -> list[bytes]:
+    """Return the literal payloads of a response, aioimaplib hands them back as bytearrays which are used without a copy."""
+    return [line for line in response.lines if isinstance(line, bytearray)]
@@ -74,7 +74,7 @@ async def async_setup_entry(
     sensors = sensors + create_bbd_sensor_entities(coordinator)
     
     _LOGGER.debug("Adding sensors.")
-    async_add_entities(sensors, update_before_add=True)
+    async_add_entities(sensors)
     _LOGGER.debug("Sensors added.")
     # return True
 
@@ -90,7 +90,17 @@ def create_bbd_sensor_entities(coordinator):#, entry_id):
     return entities
 
 
-class OcadoDelivery(CoordinatorEntity, SensorEntity): # type: ignore
+class OcadoSensor(CoordinatorEntity, SensorEntity): # type: ignore
+    """Base for the Ocado sensors."""
+
+    async def async_added_to_hass(self):
+        _LOGGER.debug("Running async_added_to_hass")
+        await super().async_added_to_hass()
+        # Show the restored snapshot straight away, the first refresh runs in the background
+        self._handle_coordinator_update()
+
+
+class OcadoDelivery(OcadoSensor): # type: ignore
     """This sensor returns the next delivery information."""
     
     _attr_device_class = DEVICE_CLASS # type: ignore
@@ -108,10 +118,6 @@ class OcadoDelivery(CoordinatorEntity, SensorEntity): # type: ignore
         self._attr_icon = "mdi:cart-outline"
         self._attr_state = None
 
-    async def async_added_to_hass(self):
-        _LOGGER.debug("Running async_added_to_hass")
-        await super().async_added_to_hass()
-
     @property
     def device_info(self) -> dict: # type: ignore
         """Return device information for device registry."""
@@ -190,7 +196,7 @@ class OcadoDelivery(CoordinatorEntity, SensorEntity): # type: ignore
                         self.async_write_ha_state()
 
 
-class OcadoEdit(CoordinatorEntity, SensorEntity): # type: ignore
+class OcadoEdit(OcadoSensor): # type: ignore
     """This sensor returns the next edit deadline information."""
     
     _attr_device_class = DEVICE_CLASS # type: ignore
@@ -208,10 +214,6 @@ class OcadoEdit(CoordinatorEntity, SensorEntity): # type: ignore
         self._attr_icon = "mdi:text-box-edit"
         self._attr_state = None
 
-    async def async_added_to_hass(self):
-        _LOGGER.debug("Running async_added_to_hass")
-        await super().async_added_to_hass()
-
     @property
     def device_info(self) -> dict: # type: ignore
         """Return device information for device registry."""
@@ -292,7 +294,7 @@ class OcadoEdit(CoordinatorEntity, SensorEntity): # type: ignore
                         self.async_write_ha_state()
 
 
-class OcadoTotal(CoordinatorEntity, SensorEntity): # type: ignore
+class OcadoTotal(OcadoSensor): # type: ignore
     """This sensor returns the next edit deadline information."""
     
     _attr_device_class = DEVICE_CLASS # type: ignore
@@ -310,10 +312,6 @@ class OcadoTotal(CoordinatorEntity, SensorEntity): # type: ignore
         self._attr_icon = "mdi:receipt-text"
         self._attr_state = None
 
-    async def async_added_to_hass(self):
-        _LOGGER.debug("Running async_added_to_hass")
-        await super().async_added_to_hass()
-
     @property
     def device_info(self) -> dict: # type: ignore
         """Return device information for device registry."""
@@ -390,7 +388,7 @@ class OcadoTotal(CoordinatorEntity, SensorEntity): # type: ignore
                 self.async_write_ha_state()
 
 
-class OcadoUpcoming(CoordinatorEntity, SensorEntity): # type: ignore
+class OcadoUpcoming(OcadoSensor): # type: ignore
     """This sensor returns the next delivery information."""
     
     _attr_device_class = DEVICE_CLASS # type: ignore
@@ -408,10 +406,6 @@ class OcadoUpcoming(CoordinatorEntity, SensorEntity): # type: ignore
         self._attr_icon = "mdi:cart-outline"
         self._attr_state = None
 
-    async def async_added_to_hass(self):
-        _LOGGER.debug("Running async_added_to_hass")
-        await super().async_added_to_hass()
-
     @property
     def device_info(self) -> dict: # type: ignore
         """Return device information for device registry."""
@@ -492,7 +486,7 @@ class OcadoUpcoming(CoordinatorEntity, SensorEntity): # type: ignore
 
 
 
-class OcadoOrderList(CoordinatorEntity, SensorEntity): # type: ignore
+class OcadoOrderList(OcadoSensor): # type: ignore
     """This sensor returns a list of all Ocado orders found."""
 
     _attr_device_class = DEVICE_CLASS # type: ignore
@@ -513,10 +507,6 @@ class OcadoOrderList(CoordinatorEntity, SensorEntity): # type: ignore
         self._attr_icon = "mdi:cart-outline"
         self._attr_state = None
 
-    async def async_added_to_hass(self):
-        _LOGGER.debug("Running async_added_to_hass")
-        await super().async_added_to_hass()
-
     @property
     def device_info(self) -> dict: # type: ignore
         """Return device information for device registry."""
@@ -593,7 +583,7 @@ class OcadoOrderList(CoordinatorEntity, SensorEntity): # type: ignore
                         self.async_write_ha_state()
 
 
-class OcadoBBDs(CoordinatorEntity, SensorEntity): # type: ignore
+class OcadoBBDs(OcadoSensor): # type: ignore
     """This sensor returns the best before dates of the most recent delivery."""
 
     _attr_device_class = DEVICE_CLASS # type: ignore
@@ -611,10 +601,6 @@ class OcadoBBDs(CoordinatorEntity, SensorEntity): # type: ignore
         self._attr_state                = None
         self._day                       = day
 
-    async def async_added_to_hass(self):
-        _LOGGER.debug("Running async_added_to_hass")
-        await super().async_added_to_hass()
-
     @property
     def device_info(self) -> dict: # type: ignore
         """Return device information for device registry."""
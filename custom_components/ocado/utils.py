@@ -1,41 +1,57 @@
 """Utilities for Ocado UK"""
-import base64
-from datetime import date, datetime, timedelta
+from collections.abc import Iterator
+from dataclasses import replace
+from datetime import date, datetime, time, timedelta, timezone
 import email
+from email.message import Message
 from email.policy import default as default_policy
-from imaplib import IMAP4_SSL as imap
+from email.utils import parsedate_to_datetime
+import hashlib
 import io
 from pypdf import PdfReader
 import json
 import logging
+import multiprocessing
+from multiprocessing.connection import Connection
 import re
-from typing import Any
 
 from dateutil.parser import parse
 
 from .const import(
+    MAX_BODY_BYTES,
+    MAX_CACHED_PDFS,
+    RECEIPT_WORKER_MEMORY,
+    RECEIPT_WORKER_TIMEOUT,
     OCADO_ADDRESS,
     OCADO_CUTOFF_SUBJECT,
+    OCADO_HEADER_ITEMS,
     OCADO_SMARTPASS_SUBJECT,
     OCADO_SUBJECT_DICT,
-    REGEX_DATE,
-    REGEX_DATE_FULL,
-    REGEX_DAY_FULL,
-    REGEX_MONTH_FULL,
-    REGEX_YEAR,
-    REGEX_TIME,
-    REGEX_ORDINALS,
-    STRING_NO_BBD,
-    REGEX_END_INDEX,
-    STRING_FREEZER,
+    CONFIRMATION_LABELS,
+    MONTHS,
+    PATTERNS,
     OcadoEmail,
     OcadoEmails,
     OcadoOrder,
     BBDLists,
     OcadoReceipt,
+    POLL_INTERVAL_NO_ORDERS,
+    POLL_INTERVAL_WAITING,
+    POLL_WINDOW_AFTER_DELIVERY,
+    POLL_WINDOW_AFTER_EDIT,
     EMPTY_ORDER,
     DAYS,
 )
+from .imap_client import (
+    MessagePart,
+    decode_transfer_encoding,
+    fetch_bodystructure,
+    fetch_message,
+    fetch_messages,
+    fetch_section,
+    probe_folder,
+    search_messages,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -51,64 +67,60 @@ def get_email_from_address(message: str) -> str:
     raise ValueError("No from address was found in email from message.")
 
 
-def get_email_from_datetime(email_date_raw: str) -> date:
-    """Parse the date of the email from the given string."""
-    email_datetime = parse(email_date_raw, fuzzy=True, dayfirst=True)
-    return email_datetime
-
-
-def get_estimated_total(message: str) -> str:
-    """Find and return the estimated total from a 'what you returned' email."""
-    pattern = r"Total\s\(estimated\):\s{1,20}(?P<total>\d+.\d{2})\sGBP"
-    raw = re.search(pattern, message)
-    if raw:
-        return raw.group('total')
-    _LOGGER.error("Failed to parse estimated total from message.")
-    raise ValueError("Failed to parse estimated total from message.")
+def get_email_from_datetime(email_date_raw: str) -> datetime:
+    """Parse the date of the email from the given string, always returning an aware datetime.
 
-
-def get_delivery_datetimes(message: str | None) -> tuple[datetime, datetime] | tuple[None, None]:
-    """Parse and return the delivery datetime."""
-    pattern = fr"Delivery\sdate:\s+(?:{REGEX_DAY_FULL}\s)?(?P<day>{REGEX_DATE})\s(?P<month>{REGEX_MONTH_FULL})\s(?P<year>{REGEX_YEAR})"
-    if message is None:
-        return None, None
-    raw = re.search(pattern, message)
-    if raw:
-        year = raw.group('year')
-        month = raw.group('month')
-        day = raw.group('day')
-    else:
-        _LOGGER.error("Delivery date not found when retrieving delivery datetime from message %s", message)
-        raise ValueError("Delivery date not found when retrieving delivery datetime from message %s", message)
-    pattern = fr"Delivery\stime:\s+(?:Between\s)?(?P<start>{REGEX_TIME})\sand\s(?P<end>{REGEX_TIME})"
-    delivery_time_raw = re.search(pattern, message)    
-    if delivery_time_raw:
-        start_time = re.sub(r"pm",r"PM",re.sub(r"am",r"AM",delivery_time_raw.group('start')))
-        end_time = re.sub(r"pm",r"PM",re.sub(r"am",r"AM",delivery_time_raw.group('end')))
-    else:        
-        _LOGGER.error("Time not found when retrieving delivery datetime from message %s", message)
-        raise ValueError("Time not found when retrieving delivery datetime from message %s", message)
-    delivery_datetime_raw = year + '-' + month + '-' + day + ' ' + start_time
-    delivery_datetime = datetime.strptime(delivery_datetime_raw,'%Y-%B-%d %I:%M%p')
-    delivery_window_end_raw = year + '-' + month + '-' + day + ' ' + end_time
-    delivery_window_end = datetime.strptime(delivery_window_end_raw,'%Y-%B-%d %I:%M%p')
-    return delivery_datetime, delivery_window_end
+    Date headers are nearly always RFC 5322, which the email package parses far faster than dateutil. Only a header
+    it can't read falls back to fuzzy parsing, where a missing offset is taken as local time.
+    """
+    try:
+        email_datetime = parsedate_to_datetime(email_date_raw)
+    except (TypeError, ValueError):
+        email_datetime = parse(email_date_raw, fuzzy=True, dayfirst=True)
+        if email_datetime.tzinfo is None:
+            email_datetime = email_datetime.astimezone()
+        return email_datetime
+    if email_datetime.tzinfo is None:
+        # An offset of -0000 means the time is UTC but the sender's zone is unknown
+        email_datetime = email_datetime.replace(tzinfo=timezone.utc)
+    return email_datetime
 
 
-def get_edit_datetime(message: str) -> datetime:
-    """Parse the edit deadline datetime."""
-    pattern = fr"(?:You\scan\sedit\sthis\sorder\suntil:?\s)(?P<time>{REGEX_TIME})(?:\son|,)\s(?P<day>{REGEX_DATE})(?:{REGEX_ORDINALS})?\s(?P<month>{REGEX_MONTH_FULL})\s(?P<year>{REGEX_YEAR})"
-    raw = re.search(pattern, message)
-    if raw:
-        edit_datetime_raw = raw.group('year') + '-' + raw.group('month') + '-' + raw.group('day') + ' ' + raw.group('time')
-        return datetime.strptime(edit_datetime_raw,'%Y-%B-%d %H:%M')
-    _LOGGER.error("No edit date found in message.")
-    raise ValueError("No edit date found in message.")
+def extract_confirmation(message: str) -> dict[str, re.Match]:
+    """Return the match for each field of a confirmation email that could be found.
+
+    Each field is matched where its label is found, so the regex engine never has to scan the body. A field whose
+    label isn't there verbatim, for example in an HTML body, is searched for in the whole message instead.
+    """
+    found = {}
+    for field, pattern in PATTERNS["confirmation"].items():
+        start = message.find(CONFIRMATION_LABELS[field])
+        match = pattern.match(message, start) if start >= 0 else None
+        if match is None:
+            match = pattern.search(message)
+        if match is not None:
+            found[field] = match
+    return found
+
+
+def _match_datetime(date_match: re.Match, date_name: str, time_match: re.Match, time_name: str) -> datetime:
+    """Build a datetime from the matched groups, using the month table rather than locale dependent strptime."""
+    hour = int(time_match.group(f"{time_name}_hour"))
+    ampm = time_match.group(f"{time_name}_ampm")
+    if ampm is not None:
+        hour = hour % 12 + (12 if ampm.lower() == "pm" else 0)
+    return datetime(
+        int(date_match.group(f"{date_name}_year")),
+        MONTHS[date_match.group(f"{date_name}_month")],
+        int(date_match.group(f"{date_name}_day")),
+        hour,
+        int(time_match.group(f"{time_name}_minute")),
+    )
 
 
 def get_order_number(message: str) -> str:
     """Parse the order number."""
-    raw = re.search(r"(?:[Oo]rder\s(?:ref(?:\.|erence):|no:|is)?(?:\s+)?)(?:<strong>)?(?P<order_number>\d+)",message)
+    raw = PATTERNS["common"]["order_number"].search(message)
     if raw:
         return raw.group('order_number')
     _LOGGER.error("No order number retrieved from message %s.", message)
@@ -121,122 +133,151 @@ def capitalise(text: str) -> str:
 
 
 
-# reversed so that we start with the newest message and break on it
-def email_triage(self) -> tuple[list[Any], OcadoEmails | None]:
-    """Access the IMAP inbox and retrieve all the relevant Ocado UK emails from the last month."""
+async def email_triage(self) -> tuple[list[int], OcadoEmails | None]:
+    """Access the IMAP inbox and retrieve all the relevant Ocado UK emails from the last month.
+
+    Parsed emails are kept in self.triage_cache by UID, so only UIDs that aren't in it yet are fetched. The cache
+    is dropped whenever the folder's UIDVALIDITY changes, since the UIDs it holds no longer mean anything.
+    A probe of the folder is compared with the last one first, so an untouched folder skips the SEARCH altogether.
+    The probe is only remembered once a triage has fetched everything it needed, so one that stops part way is run
+    in full on the next poll.
+    """
     _LOGGER.debug("Beginning email triage")
     today = date.today()
-    server = imap(host = self.imap_host, port = self.imap_port, timeout= 30)
-    server.login(self.email_address, self.password)
-    server.select(self.imap_folder, readonly=True)
-    pattern = fr'SINCE "{(today - timedelta(days=self.imap_days)).strftime("%d-%b-%Y")}" FROM "{OCADO_ADDRESS}" NOT SUBJECT "{OCADO_CUTOFF_SUBJECT}" NOT SUBJECT "{OCADO_SMARTPASS_SUBJECT}"'
-    result, message_ids = server.search(None, pattern)
-    if result != "OK":
-        _LOGGER.error("Could not connect to inbox.")
-        raise ConnectionError("Could not connect to inbox.")
-    ocado_cancelled =           []
-    ocado_confirmations =       []
-    ocado_confirmed_orders =    []
-    ocado_total =               None
-    ocado_receipt =             None
-    # Check the previous message ids and return the old state if they're the same
-    if self.data is not None:
-        if self.data.get("message_ids") == message_ids:
-            _LOGGER.debug("Returning previous state, since message_ids are unchanged.")
-            server.close()
-            server.logout()
-            return message_ids, None
-    for message_id in reversed(message_ids[0].split()):
-        result, message_data = server.fetch(message_id,"(RFC822)")
-        if message_data is None:
-            continue
-        message_data = message_data[0][1] # type: ignore
-        ocado_email = _parse_email(message_id, message_data) # type: ignore
-        # If the type of email is a cancellation, add the order number to check for later
-        if ocado_email.type == "cancellation":
-            ocado_cancelled.append(ocado_email.order_number)
-        # If the order number isn't in the list of cancelled order numbers
-        if ocado_email.order_number not in ocado_cancelled:
-            # This is done first, since if the order number exists already from a confirmation, we still want to add the receipt.
-            if ocado_email.type == "receipt":
-                # We only care about the most recent receipt
-                if ocado_receipt is None:
-                    ocado_receipt = OcadoReceipt(ocado_email.date, ocado_email.order_number)
-                    email_message = email.message_from_bytes(message_data, policy=default_policy) # type: ignore
-                    for part in email_message.iter_attachments():
-                        if part.get_content_type() == 'application/pdf':
-                            pdf_data = part.get_payload(decode=True)
-                            pdf_stream = io.BytesIO(pdf_data) # type: ignore
-                            try:
-                                reader = PdfReader(pdf_stream)
-                                page = reader.pages[0]
-                                receipt_list = page.extract_text().split('\n')
-                            except:  # noqa: E722
-                                receipt_list = []
-                                continue
-                            # Calculate the indices of the different lists
-                            fridge_index = HeaderIndex("Fridge", receipt_list)
-                            cupboard_index = HeaderIndex("Cupboard", receipt_list)
-                            end_index = FindEndIndex(receipt_list)
-                            # Set up the BBD lists
-                            fridge = BBDLists(fridge_index, None, None)
-                            cupboard = BBDLists(cupboard_index, None, None)
-                            # Set the end indices
-                            if fridge.index_start is not None:
-                                if cupboard.index_start is not None:
-                                    fridge.index_end = cupboard.index_start - 2        
-                                    cupboard.index_end = end_index
-                                else:
-                                    fridge.index_end = end_index
-                            # Now calculate the BBDs properly
-                            delivery_date_raw = re.search(REGEX_DATE_FULL, receipt_list[6])
-                            if delivery_date_raw is not None:
-                                delivery_date_raw = delivery_date_raw.group()
-                                _LOGGER.debug("delivery_date_raw found (in 6) as %s", delivery_date_raw)
-                            else:
-                                delivery_date_raw = re.search(REGEX_DATE_FULL, receipt_list[7])
-                                if delivery_date_raw is not None:
-                                    delivery_date_raw = delivery_date_raw.group()
-                                    _LOGGER.debug("delivery_date_raw found (in 7) as %s", delivery_date_raw)
-                            if delivery_date_raw is None:
-                                raise Exception
-                            _LOGGER.debug("delivery_date_raw found as %s", delivery_date_raw)
-                            fridge.update_bbds(receipt_list)
-                            cupboard.update_bbds(receipt_list)
-                            # Now save the lists as new attributes
-                            for day in DAYS[:-1]:
-                                _LOGGER.debug("Attempting to get %s from fridge & cupboard", day)
-                                _LOGGER.debug("Fridge: %s", getattr(fridge, day))
-                                _LOGGER.debug("Cupboard: %s", getattr(cupboard, day))
-                                # I think the number of cupboard bbds will be small, so combining.
-                                day_list = getattr(fridge, day) + getattr(cupboard, day)
-                                setattr(ocado_receipt, day, day_list)
-                            setattr(ocado_receipt, "date_dict", fridge.date_dict)
-            elif ocado_email.type == "confirmation":
-                # Make sure we're not adding an older version of an order we already have
-                if ocado_email.order_number not in ocado_confirmed_orders:
-                    ocado_confirmed_orders.append(ocado_email.order_number)
-                    ocado_confirmations.append(ocado_email)
-            elif ocado_email.type == "new_total":
-                # We only care about the most recent new total
-                if ocado_total is None:
-                    ocado_confirmed_orders.append(ocado_email.order_number)
-                    ocado_total = ocado_email
-
-
-    server.close()
-    server.logout()
-    # It's possible the total order number is repeated, so remove it
-    ocado_orders = list(set(ocado_confirmed_orders))
+    async with self.imap_session as server:
+        # The SEARCH window moves with the date, so it's run at least once a day even if nothing arrives
+        folder_status = await probe_folder(server, self.imap_session.folder)
+        # Only a triage that finished today can stand in for this one
+        # A snapshot restored from disk may be days old, so it is always rebuilt from the cached emails
+        up_to_date = self.data is not None and not self.data.get("restored") and self.search_date == today
+        if up_to_date and folder_status is not None and folder_status == self.folder_status:
+            self.polls_short_circuited += 1
+            _LOGGER.debug("Returning previous state, since the folder is unchanged.")
+            return self.data["message_ids"], None
+        self.search_date = None
+        pattern = fr'SINCE "{(today - timedelta(days=self.imap_days)).strftime("%d-%b-%Y")}" FROM "{OCADO_ADDRESS}" NOT SUBJECT "{OCADO_CUTOFF_SUBJECT}" NOT SUBJECT "{OCADO_SMARTPASS_SUBJECT}"'
+        uids = await search_messages(server, pattern)
+        if self.imap_session.uidvalidity != self.uidvalidity:
+            if self.uidvalidity is not None:
+                _LOGGER.info("UIDVALIDITY of %s changed, fetching all emails again.", self.imap_session.folder)
+            self.triage_cache.clear()
+            self.receipt_cache.clear()
+            self.order_cache.clear()
+            self.uidvalidity = self.imap_session.uidvalidity
+        # Forget anything that was expunged or has dropped out of the imap_days window
+        current_uids = set(uids)
+        expunged_uids = [uid for uid in self.triage_cache if uid not in current_uids]
+        for uid in expunged_uids:
+            self.triage_cache.pop(uid)
+            self.receipt_cache.pop(uid, None)
+            self.order_cache.pop(uid, None)
+        # Anything not already parsed is new, this also picks up emails that were dropped from a size-capped cache
+        new_uids = [uid for uid in uids if uid not in self.triage_cache]
+        # Return the old state if nothing has arrived or left
+        if up_to_date and not new_uids and not expunged_uids:
+            _LOGGER.debug("Returning previous state, since the UIDs are unchanged.")
+            self.folder_status = folder_status
+            self.search_date = today
+            return uids, None
+        _LOGGER.debug("Fetching %s new emails, %s expunged", len(new_uids), len(expunged_uids))
+        # Classify the new emails from their headers, so only the bodies that are needed get downloaded
+        headers: dict[int, OcadoEmail] = {}
+        async for uid, header_data in fetch_messages(server, new_uids[::-1], self.imap_fetch_batch, OCADO_HEADER_ITEMS):
+            headers[uid] = _parse_headers(uid, header_data)
+        # Receipts are fetched a part at a time below, so remember their structure between the two steps
+        receipt_parts: dict[int, list[MessagePart]] = {}
+        body_uids = _select_body_uids([headers[uid] for uid in new_uids[::-1] if uid in headers])
+        # An email whose body is needed is only cached once it has been parsed, so one that never arrived is fetched again
+        selected_uids = set(body_uids)
+        for uid, ocado_email in headers.items():
+            if uid not in selected_uids:
+                self.triage_cache[uid] = ocado_email
+        # Each body is reduced to its record as it streams in, so none are held onto
+        async for uid, message_data in fetch_messages(server, body_uids, self.imap_fetch_batch):
+            # Parsing is CPU bound, so keep it off the event loop
+            ocado_email, order = await self.hass.async_add_executor_job(_parse_record, uid, message_data, headers[uid])
+            self.triage_cache[uid] = ocado_email
+            if order is not None:
+                self.order_cache[uid] = order
+        # Sets and the order cache keep every lookup constant time however many emails are in the window
+        ocado_cancelled: set[str] =             set()
+        ocado_confirmed_orders: set[str] =      set()
+        ocado_confirmations: list[OcadoOrder] = []
+        ocado_total: OcadoOrder | None =        None
+        ocado_receipt: OcadoReceipt | None =    None
+        fetch_failed = False
+        # reversed so that we start with the newest message
+        for uid in sorted(self.triage_cache, reverse=True):
+            ocado_email = self.triage_cache[uid]
+            # An email that couldn't be parsed was logged when it was fetched, and is skipped from then on
+            if ocado_email.unreadable:
+                continue
+            # Older totals were only classified, fetch one if the newer ones turned out to be cancelled
+            if ocado_email.order_number is None and ocado_email.type == "new_total" and ocado_total is None:
+                message_data = await fetch_message(server, uid)
+                if message_data is None:
+                    fetch_failed = True
+                    continue
+                ocado_email, order = await self.hass.async_add_executor_job(_parse_record, uid, message_data, ocado_email)
+                self.triage_cache[uid] = ocado_email
+                if order is not None:
+                    self.order_cache[uid] = order
+                if ocado_email.unreadable:
+                    continue
+            # Receipts only need their text part for the order number, the PDF is fetched once we know it's wanted
+            if ocado_email.order_number is None and ocado_email.type == "receipt" and ocado_receipt is None:
+                parts = await fetch_bodystructure(server, uid)
+                if parts is None:
+                    fetch_failed = True
+                    continue
+                receipt_parts[uid] = parts
+                ocado_email = await _async_fetch_receipt_text(server, ocado_email, parts)
+                if ocado_email is None:
+                    fetch_failed = True
+                    continue
+                self.triage_cache[uid] = ocado_email
+                if ocado_email.unreadable:
+                    continue
+            # If the type of email is a cancellation, add the order number to check for later
+            if ocado_email.type == "cancellation":
+                ocado_cancelled.add(ocado_email.order_number) # type: ignore
+            # If the order number isn't in the list of cancelled order numbers
+            if ocado_email.order_number not in ocado_cancelled:
+                # This is done first, since if the order number exists already from a confirmation, we still want to add the receipt.
+                if ocado_email.type == "receipt":
+                    # We only care about the most recent receipt
+                    if ocado_receipt is None:
+                        if uid not in self.receipt_cache:
+                            # The PDF isn't held onto once it has been parsed
+                            pdf_data = await _async_fetch_receipt_pdf(server, uid, receipt_parts.get(uid))
+                            self.receipt_cache[uid] = await _async_receipt_parse(self, ocado_email, pdf_data)
+                            del pdf_data
+                        ocado_receipt = self.receipt_cache[uid]
+                elif ocado_email.type == "confirmation":
+                    # Make sure we're not adding an older version of an order we already have
+                    if ocado_email.order_number not in ocado_confirmed_orders:
+                        ocado_confirmed_orders.add(ocado_email.order_number) # type: ignore
+                        # A confirmation that couldn't be parsed has no record, and was logged when it was fetched
+                        if uid in self.order_cache:
+                            ocado_confirmations.append(self.order_cache[uid])
+                elif ocado_email.type == "new_total":
+                    # We only care about the most recent new total
+                    if ocado_total is None:
+                        ocado_confirmed_orders.add(ocado_email.order_number) # type: ignore
+                        ocado_total = self.order_cache.get(uid)
+        # A body that never arrived leaves its email out of the cache, a lazy fetch that failed is tried again too
+        if not fetch_failed and all(uid in self.triage_cache for uid in new_uids):
+            self.folder_status = folder_status
+            self.search_date = today
     triaged_emails = OcadoEmails(
-        orders = ocado_orders,
-        cancelled = ocado_cancelled,
+        orders = list(ocado_confirmed_orders),
+        cancelled = list(ocado_cancelled),
         confirmations = ocado_confirmations,
         total = ocado_total,
         receipt = ocado_receipt,
     )
     _LOGGER.debug("Returning triaged emails")
-    return message_ids, triaged_emails
+    return uids, triaged_emails
 
 
 def _ocado_email_typer(subject: str) -> str:
@@ -245,47 +286,285 @@ def _ocado_email_typer(subject: str) -> str:
     return ocado_email_type
 
 
-def _parse_email(message_id: bytes, message_data: bytes) -> OcadoEmail:
-    """Given message data, return RetrievedEmail object."""
-    email_message = email.message_from_bytes(message_data, policy=default_policy)
-    email_date = get_email_from_datetime(email_message.get("Date")) # type: ignore
-    email_from_address = get_email_from_address(email_message.get('From')) # type: ignore
+def _select_body_uids(new_emails: list[OcadoEmail]) -> list[int]:
+    """Given newly classified emails, newest first, return the UIDs whose bodies are needed."""
+    body_uids = []
+    seen_types = set()
+    for ocado_email in new_emails:
+        # A booking can be made any time before its delivery, so every cancellation and confirmation in the window is
+        # needed, and the order number is only in the body
+        if ocado_email.type in ("cancellation", "confirmation"):
+            body_uids.append(ocado_email.message_id)
+        # Only the newest new total is used, receipts are fetched by part when they're needed
+        elif ocado_email.type == "new_total" and ocado_email.type not in seen_types:
+            seen_types.add(ocado_email.type)
+            body_uids.append(ocado_email.message_id)
+    return body_uids
+
+
+async def _async_fetch_receipt_text(server, ocado_email: OcadoEmail, parts: list[MessagePart]) -> OcadoEmail | None:
+    """Fetch only the text part of a receipt and fill in its order number, or return None if the fetch failed.
+
+    A receipt without a text part or an order number in it is marked unreadable, so it isn't fetched again.
+    """
+    text_parts = [part for part in parts if part.content_type in ("text/plain", "text/html")]
+    if not text_parts:
+        _LOGGER.warning("No text part found in receipt %s", ocado_email.message_id)
+        return replace(ocado_email, unreadable=True)
+    # Prefer plain text, it's the smaller of the two
+    text_part = min(text_parts, key=lambda part: part.content_type != "text/plain")
+    text_data = await fetch_section(server, ocado_email.message_id, text_part) # type: ignore
+    if text_data is None:
+        return None
+    # Only the order number is kept, the text itself isn't needed again
+    try:
+        order_number = get_order_number(text_data.decode(text_part.charset or "utf-8", errors="replace"))
+    except ValueError:
+        _LOGGER.warning("Ignoring receipt %s without an order number", ocado_email.message_id)
+        return replace(ocado_email, unreadable=True)
+    return replace(ocado_email, order_number=order_number)
+
+
+async def _async_fetch_receipt_pdf(server, uid: int, parts: list[MessagePart] | None) -> bytes | None:
+    """Fetch only the PDF attachment of a receipt."""
+    if parts is None:
+        parts = await fetch_bodystructure(server, uid) or []
+    for part in parts:
+        if part.content_type == "application/pdf":
+            _LOGGER.debug("Fetching %s byte receipt PDF from part %s", part.size, part.section)
+            return await fetch_section(server, uid, part)
+    _LOGGER.warning("No PDF found in receipt %s", uid)
+    return None
+
+
+def _parse_headers(message_id: int, header_data: bytes) -> OcadoEmail:
+    """Given the header fields of a message, return an OcadoEmail without a body or order number."""
+    email_message = email.message_from_bytes(header_data, policy=default_policy)
     email_subject = email_message.get("Subject")
-    _LOGGER.debug("Parsing %s from %s", email_subject, email_date)
-    email_body = ""
-    # multipart will return true if there are attachments, text, html versions of the body, etc.
-    # if multipart returns true, get_payload will return a list instead of a string.
-    if email_message.is_multipart():
-        email_body = (email_message.get_body(preferencelist=('plain','html'))).as_string() # type: ignore
-    # best guess with HTML emails, which we need to use in some situations to grab tracking numbers
-    else:
-        email_body = email_message.get_body().as_string().replace('=','').replace('\n','') # type: ignore
-    if re.search(r"base64",email_body):
-        # need to remove the encoding info before decoding
-        email_body = re.sub(r"(?:.*\n.*)(base64\n\n)","",email_body)
-        email_body = base64.b64decode(email_body.encode("utf8")).decode("utf8")
+    return OcadoEmail(
+        message_id          = message_id,
+        type                = _ocado_email_typer(email_subject), # type: ignore
+        date                = get_email_from_datetime(email_message.get("Date")), # type: ignore
+        from_address        = get_email_from_address(email_message.get('From')), # type: ignore
+        subject             = email_subject,
+        body                = None,
+        order_number        = None,
+    )
+
+
+def _decode_body(part: Message | None) -> str:
+    """Decode a body part straight from its transfer encoding and charset.
+
+    At most MAX_BODY_BYTES of the encoded payload are decoded, and base64 and quoted-printable are both decoded in a
+    single linear pass, so the time spent on one message is bounded by the budget whatever its contents.
+    """
+    if part is None:
+        return ""
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return ""
+    if len(payload) > MAX_BODY_BYTES:
+        _LOGGER.debug("Body of %s characters truncated to %s", len(payload), MAX_BODY_BYTES)
+        payload = payload[:MAX_BODY_BYTES]
+    encoding = str(part.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+    if encoding == "base64":
+        # A truncated body must still end on a whole base64 quantum
+        payload = "".join(payload.split())
+        payload = payload[:len(payload) - len(payload) % 4]
+    try:
+        # Bytes that aren't ASCII were kept as surrogates when the message was parsed, this gets them back
+        data = payload.encode("ascii", errors="surrogateescape")
+    except UnicodeEncodeError:
+        # The parser has already decoded an 8bit body to text
+        if encoding not in ("base64", "quoted-printable"):
+            return payload
+        data = payload.encode("utf-8")
+    data = decode_transfer_encoding(data, encoding)
+    try:
+        return data.decode(part.get_content_charset() or "utf-8", errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def _parse_email(message_id: int, message_data: bytes, headers: OcadoEmail | None = None) -> OcadoEmail:
+    """Given message data, return RetrievedEmail object.
+
+    The message is parsed once. If its headers were already classified they are reused as they are, and only the
+    body is read from the parsed message.
+    """
+    email_message = email.message_from_bytes(message_data, policy=default_policy)
+    if headers is None:
+        headers = OcadoEmail(
+            message_id          = message_id,
+            type                = _ocado_email_typer(email_message.get("Subject")), # type: ignore
+            date                = get_email_from_datetime(email_message.get("Date")), # type: ignore
+            from_address        = get_email_from_address(email_message.get('From')), # type: ignore
+            subject             = email_message.get("Subject"),
+            body                = None,
+            order_number        = None,
+        )
+    _LOGGER.debug("Parsing %s from %s", headers.subject, headers.date)
+    # Prefer the plain text version, HTML is a best guess we need in some situations to grab tracking numbers
+    email_body = _decode_body(email_message.get_body(preferencelist=('plain','html'))) # type: ignore
     order_number = get_order_number(email_body)
     # need to add the receipt download for
     ocado_email = OcadoEmail(
         message_id          = message_id,
-        email_type          = _ocado_email_typer(email_subject), # type: ignore
-        date                = email_date,
-        from_address        = email_from_address,
-        subject             = email_subject,
+        type                = headers.type,
+        date                = headers.date,
+        from_address        = headers.from_address,
+        subject             = headers.subject,
         body                = email_body,
         order_number        = order_number,
     )
     return ocado_email
 
 
+def _parse_record(message_id: int, message_data: bytes, headers: OcadoEmail) -> tuple[OcadoEmail, OcadoOrder | None]:
+    """Parse a message down to what's kept between polls, the email without its body and the order it describes.
+
+    A message that can't be parsed is logged and kept as far as it could be read, so it's skipped rather than failing
+    the poll. Without an order number it's marked unreadable, so it isn't fetched again.
+    """
+    try:
+        ocado_email = _parse_email(message_id, message_data, headers)
+    except Exception as err: # noqa: BLE001
+        _LOGGER.warning("Ignoring %s %s that couldn't be parsed: %s", headers.type, message_id, err)
+        return replace(headers, unreadable=True), None
+    order = None
+    try:
+        if ocado_email.type == "confirmation":
+            order = order_parse(ocado_email)
+        elif ocado_email.type == "new_total":
+            order = total_parse(ocado_email)
+    except Exception as err: # noqa: BLE001
+        _LOGGER.warning("Ignoring %s %s that couldn't be parsed: %s", ocado_email.type, message_id, err)
+    return replace(ocado_email, body=None), order
+
+
+def iter_receipt_lines(pdf_data: bytes) -> Iterator[str]:
+    """Yield the lines of a receipt PDF, extracting a page at a time.
+
+    The BBD sections of a big shop can spill onto later pages, but everything after them is the rest of the
+    itemised receipt, so no page is extracted once the end of the BBD sections has been reached.
+    """
+    reader = PdfReader(io.BytesIO(pdf_data))
+    for page in reader.pages:
+        for line in page.extract_text().split('\n'):
+            yield line
+            if BBDLists.is_end(line):
+                return
+
+
+def extract_receipt_lines(pdf_data: bytes) -> list[str] | None:
+    """Extract the text of a receipt PDF as a list of lines up to the end of the BBD sections, or None if it can't be read."""
+    try:
+        return list(iter_receipt_lines(pdf_data))
+    except:  # noqa: E722
+        return None
+
+
+def _receipt_worker(connection: Connection, ocado_email: OcadoEmail, pdf_data: bytes, memory_limit: int) -> None:
+    """Extract and parse a receipt PDF in a worker process, sending back its text lines and the parsed receipt."""
+    try:
+        import resource
+        # The limit is on top of what the freshly started interpreter already uses
+        with open("/proc/self/statm") as statm:
+            in_use = int(statm.read().split()[0]) * resource.getpagesize()
+        resource.setrlimit(resource.RLIMIT_AS, (in_use + memory_limit, in_use + memory_limit))
+    except (ImportError, OSError, ValueError):
+        _LOGGER.debug("No memory limit for the receipt worker on this platform")
+    try:
+        receipt_list = extract_receipt_lines(pdf_data)
+        del pdf_data
+        connection.send((receipt_list, receipt_parse(ocado_email, receipt_list)))
+    except Exception as err:  # noqa: BLE001
+        connection.send((None, err))
+    finally:
+        connection.close()
+
+
+def _parse_receipt_in_worker(ocado_email: OcadoEmail, pdf_data: bytes) -> tuple[list[str] | None, OcadoReceipt]:
+    """Parse a receipt PDF in a separate process, so a malformed or huge PDF can't stall or bloat Home Assistant.
+
+    pypdf is pure Python and holds the GIL, so a thread isn't enough. The worker is killed if it runs past
+    RECEIPT_WORKER_TIMEOUT, and can't grow past RECEIPT_WORKER_MEMORY. Either way the receipt is treated as unreadable.
+    This blocks while it waits, so it's run in the executor.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target  = _receipt_worker,
+        args    = (sender, ocado_email, pdf_data, RECEIPT_WORKER_MEMORY),
+        name    = f"ocado_receipt_{ocado_email.message_id}",
+        daemon  = True,
+    )
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(RECEIPT_WORKER_TIMEOUT):
+            receipt_list, result = receiver.recv()
+            if isinstance(result, OcadoReceipt):
+                return receipt_list, result
+            _LOGGER.warning("Receipt %s couldn't be parsed: %s", ocado_email.message_id, result)
+        else:
+            _LOGGER.warning("Parsing receipt %s took over %s seconds, giving up", ocado_email.message_id, RECEIPT_WORKER_TIMEOUT)
+    except EOFError:
+        _LOGGER.warning("Receipt worker for %s exited without a result, likely over its memory limit", ocado_email.message_id)
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+    return None, OcadoReceipt(ocado_email.date, ocado_email.order_number)
+
+
+async def _async_receipt_parse(self, ocado_email: OcadoEmail, pdf_data: bytes | None) -> OcadoReceipt:
+    """Parse a receipt PDF, extracting its text only the first time that PDF is seen."""
+    if pdf_data is None:
+        return OcadoReceipt(ocado_email.date, ocado_email.order_number)
+    key = hashlib.sha256(pdf_data).hexdigest()
+    if key in self.pdf_cache:
+        _LOGGER.debug("Receipt PDF %s already extracted", key[:12])
+        self.pdf_cache.move_to_end(key)
+        return await self.hass.async_add_executor_job(receipt_parse, ocado_email, self.pdf_cache[key])
+    receipt_list, ocado_receipt = await self.hass.async_add_executor_job(_parse_receipt_in_worker, ocado_email, pdf_data)
+    if receipt_list is not None:
+        self.pdf_cache[key] = receipt_list
+        while len(self.pdf_cache) > MAX_CACHED_PDFS:
+            self.pdf_cache.popitem(last=False)
+    return ocado_receipt
+
+
+def receipt_parse(ocado_email: OcadoEmail, receipt_list: list[str] | None) -> OcadoReceipt:
+    """Parse the text lines of the PDF attached to an Ocado receipt email into an OcadoReceipt object."""
+    ocado_receipt = OcadoReceipt(ocado_email.date, ocado_email.order_number)
+    if receipt_list is None:
+        return ocado_receipt
+    bbd_lists = BBDLists()
+    for line in receipt_list:
+        if not bbd_lists.feed(line):
+            break
+    bbd_lists.finish()
+    _LOGGER.debug("delivery_date found as %s", bbd_lists.delivery_date)
+    _LOGGER.debug("BBDs: %s", bbd_lists.bbds)
+    return OcadoReceipt(
+        updated         = ocado_email.date,
+        order_number    = ocado_email.order_number,
+        bbds            = tuple(map(tuple, bbd_lists.bbds)),
+        dates           = bbd_lists.dates,
+        longer          = tuple(bbd_lists.longer),
+        columns         = bbd_lists.columns,
+    )
+
+
 def total_parse(ocado_email: OcadoEmail) -> OcadoOrder:
     """Parse an Ocado total email into an OcadoOrder object."""
     # TODO return order number and actual total.
     message = ocado_email.body
     if message is None:
         return EMPTY_ORDER
-    pattern = r"New\sorder\stotal:\s{1,20}(?P<total>\d+.\d{1,2})\sGBP"
-    raw = re.search(pattern, message)
+    raw = PATTERNS["new_total"]["total"].search(message)
     if raw:
         total = raw.group("total")
     else:
@@ -301,19 +580,67 @@ def total_parse(ocado_email: OcadoEmail) -> OcadoOrder:
     return total
 
 
+def snapshot_to_dict(payload: dict) -> dict:
+    """Convert the coordinator data into something that can be stored as JSON."""
+    orders = payload.get("orders")
+    return {
+        "updated"       : payload["updated"].isoformat(),
+        "message_ids"   : payload["message_ids"],
+        "next"          : payload["next"].as_dict() if payload.get("next") is not None else None,
+        "upcoming"      : payload["upcoming"].as_dict() if payload.get("upcoming") is not None else None,
+        "total"         : payload["total"].as_dict() if payload.get("total") is not None else None,
+        "receipt"       : payload["receipt"].as_dict() if payload.get("receipt") is not None else None,
+        "orders"        : [order.as_dict() for order in orders] if orders is not None else None,
+    }
+
+
+def snapshot_from_dict(snapshot: dict) -> dict:
+    """Rebuild the coordinator data from a stored snapshot, marked as restored until the first refresh replaces it."""
+    orders = snapshot["orders"]
+    return {
+        "updated"       : datetime.fromisoformat(snapshot["updated"]),
+        "message_ids"   : snapshot["message_ids"],
+        "next"          : OcadoOrder.from_dict(snapshot["next"]) if snapshot["next"] is not None else None,
+        "upcoming"      : OcadoOrder.from_dict(snapshot["upcoming"]) if snapshot["upcoming"] is not None else None,
+        "total"         : OcadoOrder.from_dict(snapshot["total"]) if snapshot["total"] is not None else None,
+        "receipt"       : OcadoReceipt.from_dict(snapshot["receipt"]) if snapshot["receipt"] is not None else None,
+        "orders"        : [OcadoOrder.from_dict(order) for order in orders] if orders is not None else None,
+        "restored"      : True,
+    }
+
+
 def order_parse(ocado_email: OcadoEmail) -> OcadoOrder:
     """Parse an Ocado confirmation email into an OcadoOrder object."""
     message = ocado_email.body
     if message is None:
         return EMPTY_ORDER
-    delivery_datetime, delivery_window_end = get_delivery_datetimes(message)
+    fields = extract_confirmation(message)
+    if "delivery_date" not in fields:
+        _LOGGER.error("Delivery date not found when retrieving delivery datetime from message %s", message)
+        raise ValueError("Delivery date not found when retrieving delivery datetime from message %s", message)
+    if "delivery_time" not in fields:
+        _LOGGER.error("Time not found when retrieving delivery datetime from message %s", message)
+        raise ValueError("Time not found when retrieving delivery datetime from message %s", message)
+    if "edit_datetime" not in fields:
+        _LOGGER.error("No edit date found in message.")
+        raise ValueError("No edit date found in message.")
+    if "estimated_total" not in fields:
+        _LOGGER.error("Failed to parse estimated total from message.")
+        raise ValueError("Failed to parse estimated total from message.")
+    order_number = ocado_email.order_number
+    if order_number is None and "order_number" in fields:
+        order_number = fields["order_number"].group("order_number")
+    # The delivery date and time are separate lines, so the two matches are combined
+    delivery_date = fields["delivery_date"]
+    delivery_time = fields["delivery_time"]
+    edit = fields["edit_datetime"]
     order = OcadoOrder(
         updated             = ocado_email.date,
-        order_number        = ocado_email.order_number,
-        delivery_datetime   = delivery_datetime,
-        delivery_window_end = delivery_window_end,
-        edit_datetime       = get_edit_datetime(message),
-        estimated_total     = get_estimated_total(message),
+        order_number        = order_number,
+        delivery_datetime   = _match_datetime(delivery_date, "delivery", delivery_time, "start"),
+        delivery_window_end = _match_datetime(delivery_date, "delivery", delivery_time, "end"),
+        edit_datetime       = _match_datetime(edit, "edit", edit, "edit"),
+        estimated_total     = fields["estimated_total"].group("total"),
     )
     return order
 
@@ -382,6 +709,39 @@ def sort_orders(orders: list[OcadoOrder]) -> tuple[OcadoOrder, OcadoOrder]:
 
 
 
+def get_poll_interval(orders: list[OcadoOrder], now: datetime, scan_interval: timedelta) -> timedelta:
+    """Poll at the scan interval around the times Ocado emails are expected, and back off in between.
+
+    Changes come in just after an edit deadline passes and the receipt on the delivery day, so those windows are
+    polled at the scan interval. Otherwise polls are hourly while there are orders to wait for, every few hours
+    when there aren't, but never so far apart that the start of the next window is missed.
+    """
+    windows = []
+    for order in orders:
+        if order.edit_datetime is not None:
+            windows.append((order.edit_datetime, order.edit_datetime + POLL_WINDOW_AFTER_EDIT))
+        if order.delivery_datetime is not None and order.delivery_window_end is not None:
+            delivery_day = datetime.combine(order.delivery_datetime.date(), time.min)
+            windows.append((delivery_day, order.delivery_window_end + POLL_WINDOW_AFTER_DELIVERY))
+    interval = POLL_INTERVAL_WAITING if any(end > now for _, end in windows) else POLL_INTERVAL_NO_ORDERS
+    for start, end in windows:
+        if start <= now <= end:
+            return scan_interval
+        if now < start:
+            interval = min(interval, start - now)
+    return max(interval, scan_interval)
+
+
+def get_next_transition(orders: list[OcadoOrder], now: datetime) -> datetime:
+    """Return the next time the sensors change on their own, an edit deadline, the end of a delivery or midnight."""
+    transition = datetime.combine(now.date() + timedelta(days=1), time.min)
+    for order in orders:
+        for moment in (order.edit_datetime, order.delivery_window_end):
+            if moment is not None and now < moment < transition:
+                transition = moment
+    return transition
+
+
 def set_order(self, order: OcadoOrder, now: datetime) -> bool:
     """This function validates an order is in the future and sets the state and attributes if it is."""
     _LOGGER.debug("Setting order")
@@ -439,23 +799,23 @@ def set_total(self, order: OcadoOrder, now: datetime) -> bool:
 def set_bbds(self, email: OcadoReceipt, day: str, now: datetime) -> bool:
     """This function validates a pdf receipt and returns the formatted BBDs."""
     _LOGGER.debug("Setting bbd")
-    if hasattr(email, day) is True and hasattr(email, "date_dict") is True:
+    weekday = DAYS.index(day)
+    # A receipt that couldn't be read has no dates to count down to
+    if weekday < len(email.dates):
         today = now.date()
-        date_dict = getattr(email, "date_dict")
-        day_list = getattr(email, day)
-        if day_list is not None: # type: ignore            
-            day_date = date_dict.get(DAYS.index(day))
-            days_until = (day_date - today).days
-            self._attr_state = len(day_list)
-            self._attr_icon = bbd_iconify(days_until)
-            attributes = {
-                "updated"               : email.updated,
-                "order_number"          : email.order_number,
-                "date"                  : day_date,
-                "bbds"                  : day_list,
-            }
-            self._hass_custom_attributes = attributes
-            return True
+        day_list = list(email.bbds[weekday])
+        day_date = email.dates[weekday]
+        days_until = (day_date - today).days
+        self._attr_state = len(day_list)
+        self._attr_icon = bbd_iconify(days_until)
+        attributes = {
+            "updated"               : email.updated,
+            "order_number"          : email.order_number,
+            "date"                  : day_date,
+            "bbds"                  : day_list,
+        }
+        self._hass_custom_attributes = attributes
+        return True
     return False
 
 
@@ -468,52 +828,3 @@ def convert_attributes(obj):
 
 def detect_attr_changes(d1: dict,d2: dict) -> bool:
     return hash(json.dumps(d1, sort_keys=True, default=convert_attributes)) != hash(json.dumps(d2, sort_keys=True, default=convert_attributes))
-
-
-def HeaderIndex(string: str, receipt_list: list) -> int | None:
-    """Returns the first index of a header in a list and removes any other occurences from the list."""
-    count = receipt_list.count(string)
-    indices = []
-    if count == 0:
-        return None
-    index = 0
-    while count > 0:
-        index = receipt_list.index(string, index)
-        indices.append(index)
-        index += 1
-        count -= 1
-    first_index = indices.pop(0)
-    for i in range(len(indices)):
-        receipt_list.pop(indices[i])
-    return first_index
-
-
-def BBDIndex(string: str, receipt_list: list) -> list[int] | None:
-    """Returns the indices of all occurences in a list."""
-    count = receipt_list.count(string)
-    indices = []
-    if count == 0:
-        return None
-    index = 0
-    while count > 0:
-        index = receipt_list.index(string, index)
-        indices.append(index)
-        index += 1
-        count -= 1
-    return indices
-
-
-def FindEndIndex(receipt_list: list) -> int:
-    index = -1
-    if STRING_NO_BBD in receipt_list:
-        index = receipt_list.index(STRING_NO_BBD)
-        return index
-    elif STRING_FREEZER in receipt_list:
-        index = receipt_list.index(STRING_FREEZER)
-        return index
-    else:
-        for i in range(len(receipt_list)):
-            if re.search(REGEX_END_INDEX, receipt_list[i]):
-                index = receipt_list[i]
-                break
-        return index
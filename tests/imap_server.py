@@ -0,0 +1,181 @@
+"""A minimal asyncio IMAP server used as a local stand-in for tests."""
+
+import asyncio
+import email
+from email.message import Message
+import re
+
+
+class FakeImapServer:
+    """Serve a list of RFC822 messages over plain-text IMAP on localhost."""
+
+    def __init__(self, messages: list[bytes], latency: float = 0.0, capabilities: tuple[str, ...] = ("IMAP4rev1",)) -> None:
+        self.latency        = latency
+        self.capabilities   = capabilities
+        self.uidvalidity    = 1
+        self.uidnext        = 1
+        self.mailbox: dict[int, bytes] = {}
+        self.commands: list[str] = []
+        self.fetched: list[tuple[int, str]] = []
+        self.logins         = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._idlers: set[asyncio.StreamWriter] = set()
+        for message in messages:
+            self.add_message(message)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1] # type: ignore
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    def add_message(self, message: bytes) -> int:
+        """Deliver a new message and tell any IDLE sessions about it."""
+        uid = self.uidnext
+        self.uidnext += 1
+        self.mailbox[uid] = message
+        for writer in self._idlers:
+            writer.write(b"* %d EXISTS\r\n" % len(self.mailbox))
+        return uid
+
+    def expunge(self, uid: int) -> None:
+        """Remove a message from the folder."""
+        self.mailbox.pop(uid)
+
+    def drop_connections(self) -> None:
+        """Simulate the server timing out every open session."""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def stop(self) -> None:
+        self.drop_connections()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        writer.write(b"* OK IMAP4rev1 fake server ready\r\n")
+        await writer.drain()
+        try:
+            while line := await reader.readline():
+                tag, command, args = self._split(line.decode().rstrip("\r\n"))
+                self.commands.append(command)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if command == "IDLE":
+                    self._idlers.add(writer)
+                    writer.write(b"+ idling\r\n")
+                    await writer.drain()
+                    await reader.readline()
+                    self._idlers.discard(writer)
+                writer.write(self._respond(tag, command, args))
+                await writer.drain()
+                if command == "LOGOUT":
+                    break
+        except ConnectionResetError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._idlers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _split(line: str) -> tuple[str, str, str]:
+        tag, _, rest = line.partition(" ")
+        command, _, args = rest.partition(" ")
+        command = command.upper()
+        if command == "UID":
+            command, _, args = args.partition(" ")
+            command = "UID " + command.upper()
+        return tag, command, args
+
+    def _respond(self, tag: str, command: str, args: str) -> bytes:
+        out = b""
+        uids = list(self.mailbox)
+        if command == "CAPABILITY":
+            out += f"* CAPABILITY {' '.join(self.capabilities)}\r\n".encode()
+        elif command == "LOGIN":
+            self.logins += 1
+        elif command in ("SELECT", "EXAMINE"):
+            out += b"* %d EXISTS\r\n" % len(self.mailbox)
+            out += b"* OK [UIDVALIDITY %d] UIDs valid\r\n" % self.uidvalidity
+            out += b"* OK [UIDNEXT %d] Predicted next UID\r\n" % self.uidnext
+        elif command == "STATUS":
+            folder = args.rpartition(" (")[0]
+            out += b"* STATUS %s (MESSAGES %d UIDNEXT %d UIDVALIDITY %d)\r\n" % (
+                folder.encode(), len(self.mailbox), self.uidnext, self.uidvalidity
+            )
+        elif command in ("SEARCH", "UID SEARCH"):
+            ids = uids if command == "UID SEARCH" else range(1, len(uids) + 1)
+            out += f"* SEARCH {' '.join(str(i) for i in ids)}".rstrip().encode() + b"\r\n"
+        elif command in ("FETCH", "UID FETCH"):
+            message_set, _, items = args.partition(" ")
+            item = items.strip("()").replace(".PEEK", "").removeprefix("UID ")
+            by_uid = command == "UID FETCH"
+            for number in self._message_set(message_set, uids[-1] if by_uid and uids else len(uids)):
+                uid = number if by_uid else uids[number - 1]
+                if uid not in self.mailbox:
+                    continue
+                self.fetched.append((uid, item))
+                if item == "BODYSTRUCTURE":
+                    structure = self._bodystructure(email.message_from_bytes(self.mailbox[uid]))
+                    out += b"* %d FETCH (UID %d BODYSTRUCTURE %s)\r\n" % (uids.index(uid) + 1, uid, structure.encode())
+                    continue
+                data = self._section(self.mailbox[uid], item)
+                out += b"* %d FETCH (UID %d %s {%d}\r\n" % (uids.index(uid) + 1, uid, item.encode(), len(data)) + data + b")\r\n"
+        elif command == "LOGOUT":
+            out += b"* BYE logging out\r\n"
+        return out + f"{tag} OK {command} completed\r\n".encode()
+
+    @staticmethod
+    def _section(message: bytes, item: str) -> bytes:
+        """Return the part of the message asked for by a BODY[...] fetch item."""
+        section = re.search(r"BODY\[(.*)\]", item)
+        if section is None or not section.group(1):
+            return message
+        header, _, text = message.replace(b"\r\n", b"\n").partition(b"\n\n")
+        if section.group(1) == "TEXT":
+            return text
+        if re.fullmatch(r"[\d.]+", section.group(1)):
+            part = email.message_from_bytes(message)
+            for number in section.group(1).split("."):
+                if part.is_multipart():
+                    part = part.get_payload(int(number) - 1)
+            return part.get_payload().encode()
+        fields = re.search(r"HEADER\.FIELDS \((.*)\)", section.group(1))
+        wanted = {field.lower() for field in fields.group(1).split()} if fields else None
+        kept, keep = [], False
+        for line in header.split(b"\n"):
+            if not line[:1].isspace():
+                keep = wanted is None or line.partition(b":")[0].strip().lower().decode() in wanted
+            if keep:
+                kept.append(line)
+        return b"\r\n".join(kept) + b"\r\n\r\n"
+
+    @classmethod
+    def _bodystructure(cls, part: Message) -> str:
+        """Describe a parsed message the way BODYSTRUCTURE does, without the extension data."""
+        if part.is_multipart():
+            children = "".join(cls._bodystructure(child) for child in part.get_payload())
+            return f'({children} "{part.get_content_subtype()}")'
+        params = " ".join(f'"{key}" "{value}"' for key, value in (part.get_params() or [])[1:])
+        params = f"({params})" if params else "NIL"
+        encoding = part.get("Content-Transfer-Encoding", "7bit")
+        return (
+            f'("{part.get_content_maintype()}" "{part.get_content_subtype()}" {params} NIL NIL '
+            f'"{encoding}" {len(part.get_payload())})'
+        )
+
+    @staticmethod
+    def _message_set(message_set: str, last: int) -> list[int]:
+        numbers = []
+        for part in message_set.split(","):
+            if match := re.fullmatch(r"(\d+):(\d+|\*)", part):
+                end = last if match.group(2) == "*" else int(match.group(2))
+                numbers.extend(range(int(match.group(1)), end + 1))
+            else:
+                numbers.append(int(part))
+        return numbers
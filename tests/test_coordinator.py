@@ -10,8 +10,39 @@
 # from custom_components.ocado.const import OcadoOrder
 # from custom_components.ocado.coordinator import OcadoUpdateCoordinator
 
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import inspect
+from unittest.mock import patch
+
+from homeassistant.const import CONF_EMAIL, CONF_PASSWORD
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 from homeassistant.setup import async_setup_component
-from custom_components.ocado.const import DOMAIN
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.ocado.const import (
+    CONF_IMAP_FOLDER,
+    CONF_IMAP_PORT,
+    CONF_IMAP_SERVER,
+    CONF_IMAP_SSL,
+    DEFAULT_IDLE_SCAN_INTERVAL,
+    DEFAULT_SCAN_INTERVAL,
+    DOMAIN,
+    OcadoEmail,
+    OcadoOrder,
+    OcadoReceipt,
+)
+from custom_components.ocado.coordinator import OcadoUpdateCoordinator
+
+from .imap_server import FakeImapServer
+
+# The coordinator hands its config entry to DataUpdateCoordinator, which older Home Assistant releases don't take
+requires_coordinator_config_entry = pytest.mark.skipif(
+    "config_entry" not in inspect.signature(DataUpdateCoordinator.__init__).parameters,
+    reason="DataUpdateCoordinator doesn't take a config entry in this Home Assistant release",
+)
 
 
 async def test_async_setup(hass):
@@ -19,6 +50,83 @@ async def test_async_setup(hass):
     assert await async_setup_component(hass, DOMAIN, {}) is True
 
 
+def _coordinator(hass, port: int = 993) -> OcadoUpdateCoordinator:
+    """Return a coordinator reading from the local IMAP stand-in."""
+    entry = MockConfigEntry(
+        domain  = DOMAIN,
+        title   = "Ocado",
+        data    = {
+            CONF_EMAIL          : "test@example.com",
+            CONF_PASSWORD       : "password123",
+            CONF_IMAP_SERVER    : "127.0.0.1",
+            CONF_IMAP_PORT      : port,
+            CONF_IMAP_FOLDER    : "INBOX",
+            CONF_IMAP_SSL       : "none",
+        },
+    )
+    entry.add_to_hass(hass)
+    return OcadoUpdateCoordinator(hass, entry)
+
+
+def _order(order_number: str, edited: datetime) -> OcadoOrder:
+    return OcadoOrder(None, order_number, edited + timedelta(days=1), edited + timedelta(days=1, hours=1), edited, "3.50")
+
+
+async def _wait_for(condition) -> None:
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("Condition never met")
+
+
+@requires_coordinator_config_entry
+async def test_idle_loop_without_idle_keeps_polling(hass, socket_enabled):
+    """A server without IDLE is left straight away, and polling carries on."""
+    server = FakeImapServer([])
+    await server.start()
+    coordinator = _coordinator(hass, server.port)
+    await asyncio.wait_for(coordinator.async_idle_loop(), 5)
+    assert coordinator.push_active is False
+    assert "IDLE" not in server.commands
+    assert server.commands[-1] == "LOGOUT"
+    await server.stop()
+
+
+@requires_coordinator_config_entry
+async def test_idle_loop_refreshes_and_reschedules_when_it_drops(hass, socket_enabled):
+    """A pushed change asks for a refresh, and a dropped IDLE moves the next poll up rather than waiting out the slow one."""
+    server = FakeImapServer([], capabilities=("IMAP4rev1", "IDLE"))
+    await server.start()
+    coordinator = _coordinator(hass, server.port)
+    # An order whose edit deadline has just passed is polled at the scan interval
+    edited = datetime.now() - timedelta(minutes=10)
+    coordinator.data = {"orders": [_order("1001", edited)]}
+    unsub = coordinator.async_add_listener(lambda: None)
+    intervals = []
+
+    async def folder_changes(client):
+        intervals.append(coordinator.update_interval)
+        if len(intervals) > 1:
+            raise ConnectionError("connection dropped")
+        return True
+
+    with patch("custom_components.ocado.coordinator.wait_for_folder_change", folder_changes), patch.object(
+        coordinator, "async_request_refresh"
+    ) as refresh, patch.object(coordinator, "_schedule_refresh", wraps=coordinator._schedule_refresh) as schedule:
+        idle = asyncio.create_task(coordinator.async_idle_loop())
+        try:
+            await _wait_for(lambda: schedule.called)
+        finally:
+            idle.cancel()
+    assert refresh.await_count == 1
+    assert intervals == [timedelta(seconds=DEFAULT_IDLE_SCAN_INTERVAL)] * 2
+    assert coordinator.push_active is False
+    assert coordinator.update_interval == timedelta(seconds=DEFAULT_SCAN_INTERVAL)
+    unsub()
+    await server.stop()
+
+
 # @pytest.mark.asyncio
 # async def test_coordinator_setup(hass: HomeAssistant, mock_config_entry, aioclient_mock):
 #     # Set up the config entry
@@ -67,4 +175,54 @@ async def test_async_setup(hass):
 
 #     # Assert the data was fetched correctly
 #     assert coordinator.last_update_success
-#     assert coordinator.data[""] == data[""] #
\ No newline at end of file
+#     assert coordinator.data[""] == data[""] #
+
+
+@requires_coordinator_config_entry
+async def test_cache_round_trips_through_store(hass):
+    """The newest parsed emails and the sensor data are restored after a restart, and the sensors are put on a timer."""
+    coordinator = _coordinator(hass)
+    sent = datetime(2025, 6, 20, 9, 0, tzinfo=timezone.utc)
+    order = _order("1003", datetime.now() + timedelta(hours=2))
+    coordinator.uidvalidity = 7
+    coordinator.triage_cache = {
+        uid: OcadoEmail(uid, email_type, sent, "noreply@email.ocado.com", None, None, order_number)
+        for uid, email_type, order_number in ((1, "confirmation", "1001"), (2, "receipt", "1002"), (3, "confirmation", "1003"))
+    }
+    coordinator.order_cache = {1: _order("1001", datetime(2025, 6, 1)), 3: order}
+    coordinator.receipt_cache = {2: OcadoReceipt(sent, "1002")}
+    coordinator.pdf_cache = OrderedDict({"abc": ["Use by Monday", "Milk"]})
+    coordinator.data = {
+        "updated"       : sent,
+        "message_ids"   : [1, 2, 3],
+        "next"          : order,
+        "upcoming"      : None,
+        "total"         : None,
+        "receipt"       : coordinator.receipt_cache[2],
+        "orders"        : [order],
+    }
+    with patch("custom_components.ocado.coordinator.MAX_CACHED_EMAILS", 2):
+        await coordinator.async_flush_cache()
+
+    restarted = OcadoUpdateCoordinator(hass, coordinator.config_entry)
+    await restarted.async_load_cache()
+    assert restarted.uidvalidity == 7
+    assert restarted.triage_cache == {uid: coordinator.triage_cache[uid] for uid in (2, 3)}
+    assert restarted.order_cache == {3: order}
+    assert restarted.receipt_cache == coordinator.receipt_cache
+    assert restarted.receipts == {"1002": coordinator.receipt_cache[2]}
+    assert restarted.pdf_cache == coordinator.pdf_cache
+    assert restarted.data.pop("restored") is True
+    assert restarted.data == coordinator.data
+    assert restarted._unsub_transition is not None
+    restarted.async_cancel_transition()
+
+
+@requires_coordinator_config_entry
+async def test_unreadable_cache_is_ignored(hass):
+    """A cache missing a key is logged and ignored rather than failing setup."""
+    coordinator = _coordinator(hass)
+    await coordinator._store.async_save({"emails": {}, "receipts": {}, "orders": {}, "pdfs": {}, "snapshot": None})
+    await coordinator.async_load_cache()
+    assert coordinator.uidvalidity is None
+    assert coordinator.data is None
@@ -0,0 +1,541 @@
+"""Test the asyncio IMAP mail source."""
+
+import asyncio
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+import json
+import multiprocessing
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from aioimaplib import Response
+import pytest
+
+from custom_components.ocado.imap_client import (
+    OcadoImapSession,
+    connect_to_server,
+    decode_transfer_encoding,
+    disconnect_from_server,
+    fetch_messages,
+    parse_bodystructure,
+    parse_fetch_response,
+    wait_for_folder_change,
+)
+from custom_components.ocado.const import RECEIPT_COLUMNS, OcadoEmail, OcadoOrder, OcadoReceipt, OcadoReceiptItem
+from custom_components.ocado.utils import (
+    _async_receipt_parse,
+    _parse_receipt_in_worker,
+    email_triage,
+    snapshot_from_dict,
+    snapshot_to_dict,
+)
+
+from .imap_server import FakeImapServer
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+async def imap_server(socket_enabled):
+    """Start a local IMAP stand-in serving the basic fixture."""
+    server = FakeImapServer([_basic_email()], latency=0.2)
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+async def imap_session(imap_server):
+    """Return a plain-text session against the local IMAP stand-in."""
+    session = OcadoImapSession(
+        host        = "127.0.0.1",
+        port        = imap_server.port,
+        email       = "test@example.com",
+        password    = "password123",
+        folder      = "INBOX",
+        imap_ssl    = "none",
+    )
+    yield session
+    await session.async_close()
+
+
+def _basic_email() -> bytes:
+    """Return the basic fixture, sent today so it's inside the imap_days window, with the year Ocado includes in the delivery date."""
+    message = (FIXTURES / "basic.eml").read_bytes().replace(b"Delivery date:                 Sunday 22 June", b"Delivery date:                 Sunday 22 June 2025")
+    return message.replace(b"Mon, 27 May 2025 15:00:00 +0000", format_datetime(datetime.now(timezone.utc)).encode())
+
+
+def _mock_coordinator(hass, session: OcadoImapSession) -> SimpleNamespace:
+    return SimpleNamespace(
+        hass            = hass,
+        imap_session    = session,
+        imap_days       = 31,
+        imap_fetch_batch = 10,
+        data            = None,
+        uidvalidity     = None,
+        triage_cache    = {},
+        receipt_cache   = {},
+        order_cache     = {},
+        pdf_cache       = OrderedDict(),
+        folder_status   = None,
+        search_date     = None,
+        polls_short_circuited = 0,
+    )
+
+
+def _email(subject: str, content: str, sent: datetime | None = None) -> bytes:
+    message = EmailMessage()
+    message["From"] = "Ocado <noreply@email.ocado.com>"
+    message["Date"] = format_datetime(sent or datetime.now(timezone.utc))
+    message["Subject"] = subject
+    message.set_content(content)
+    return message.as_bytes()
+
+
+def _receipt(order_number: str, pdf_data: bytes) -> bytes:
+    message = EmailMessage()
+    message["From"] = "Ocado <noreply@email.ocado.com>"
+    message["Date"] = format_datetime(datetime.now(timezone.utc))
+    message["Subject"] = "Your receipt and updates for today’s delivery"
+    message.set_content(f"Order ref.: {order_number}\n")
+    message.add_alternative(f"<p>Order ref.: {order_number}</p>", subtype="html")
+    message.add_attachment(pdf_data, maintype="application", subtype="pdf", filename="receipt.pdf")
+    return message.as_bytes()
+
+
+def _confirmation(order_number: str, sent: datetime | None = None) -> bytes:
+    return _email(
+        "Confirmation of your order",
+        f"Order ref.: {order_number}\n"
+        "Delivery date: Sunday 22 June 2025\n"
+        "Delivery time: 10:00am and 11:00am\n"
+        "You can edit this order until: 17:25 on 21st June 2025\n"
+        "Total (estimated): 3.50 GBP\n",
+        sent,
+    )
+
+
+async def test_email_triage_does_not_block_the_loop(hass, imap_server, imap_session):
+    """Every server round trip is slow, but the event loop must keep ticking."""
+    gaps = []
+
+    async def heartbeat():
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            await asyncio.sleep(0.01)
+            now = loop.time()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(heartbeat())
+    with patch("imaplib.IMAP4.__init__", side_effect=AssertionError("blocking imaplib used")):
+        message_ids, triaged = await email_triage(_mock_coordinator(hass, imap_session))
+    ticker.cancel()
+
+    assert message_ids == [1]
+    assert [email.order_number for email in triaged.confirmations] == ["1234567891"]
+    assert triaged.receipt is None
+    assert triaged.total is None
+    # Every command takes 0.2s, the loop must never have stalled for one of them
+    assert max(gaps) < 0.1
+    assert imap_server.commands == ["CAPABILITY", "LOGIN", "SELECT", "SELECT", "UID SEARCH", "UID FETCH", "UID FETCH"]
+
+
+async def test_email_triage_unchanged_message_ids(hass, imap_server, imap_session):
+    """An unchanged SEARCH result returns the previous state without fetching."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    message_ids, _ = await email_triage(coordinator)
+    coordinator.data = {"message_ids": message_ids}
+    imap_server.commands.clear()
+    message_ids, triaged = await email_triage(coordinator)
+    assert message_ids == [1]
+    assert triaged is None
+    assert "UID FETCH" not in imap_server.commands
+
+
+async def test_email_triage_status_probe(hass, imap_server, imap_session):
+    """An unchanged folder probe skips the SEARCH, a new message or a new day runs it again."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    message_ids, _ = await email_triage(coordinator)
+    coordinator.data = {"message_ids": message_ids}
+    imap_server.commands.clear()
+    message_ids, triaged = await email_triage(coordinator)
+    assert message_ids == [1]
+    assert triaged is None
+    assert "UID SEARCH" not in imap_server.commands
+    assert coordinator.polls_short_circuited == 1
+
+    imap_server.add_message(_confirmation("1001"))
+    imap_server.commands.clear()
+    message_ids, _ = await email_triage(coordinator)
+    assert message_ids == [1, 2]
+    assert "UID SEARCH" in imap_server.commands
+
+    coordinator.data = {"message_ids": message_ids}
+    coordinator.search_date = None
+    imap_server.commands.clear()
+    await email_triage(coordinator)
+    assert "UID SEARCH" in imap_server.commands
+    assert coordinator.polls_short_circuited == 1
+
+
+async def test_email_triage_refetches_bodies_that_never_arrived(hass, imap_server, imap_session):
+    """A body fetch that fails part way leaves those emails to be fetched in full on the next poll."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    real_fetch_messages = fetch_messages
+
+    async def dropped_connection(server, uids, batch_size, items="BODY.PEEK[]"):
+        if items == "BODY.PEEK[]":
+            raise ConnectionError("connection dropped")
+        async for message in real_fetch_messages(server, uids, batch_size, items):
+            yield message
+
+    with patch("custom_components.ocado.utils.fetch_messages", dropped_connection), pytest.raises(ConnectionError):
+        await email_triage(coordinator)
+    assert coordinator.triage_cache == {}
+    _, triaged = await email_triage(coordinator)
+    assert [order.order_number for order in triaged.confirmations] == ["1234567891"]
+    assert triaged.orders == ["1234567891"]
+
+
+async def test_email_triage_retries_after_a_missed_body(hass, imap_server, imap_session):
+    """A poll that misses a body isn't short-circuited afterwards, however often the folder is probed."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    message_ids, _ = await email_triage(coordinator)
+    coordinator.data = {"message_ids": message_ids}
+    confirmation = imap_server.add_message(_confirmation("1001"))
+    real_fetch_messages = fetch_messages
+
+    async def bodies_never_arrive(server, uids, batch_size, items="BODY.PEEK[]"):
+        if items != "BODY.PEEK[]":
+            async for message in real_fetch_messages(server, uids, batch_size, items):
+                yield message
+
+    with patch("custom_components.ocado.utils.fetch_messages", bodies_never_arrive):
+        message_ids, _ = await email_triage(coordinator)
+    assert confirmation not in coordinator.triage_cache
+    coordinator.data = {"message_ids": message_ids}
+    _, triaged = await email_triage(coordinator)
+    assert (confirmation, "BODY[]") in imap_server.fetched
+    assert {order.order_number for order in triaged.confirmations} == {"1234567891", "1001"}
+    assert coordinator.polls_short_circuited == 0
+    coordinator.data = {"message_ids": message_ids}
+    _, triaged = await email_triage(coordinator)
+    assert triaged is None
+    assert coordinator.polls_short_circuited == 1
+
+
+async def test_email_triage_skips_malformed_bodies(hass, imap_server, imap_session):
+    """An email whose body can't be parsed is skipped, not fetched again, and doesn't fail the poll."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    imap_server.add_message(_email("Confirmation of your order", "Nothing to see here\n"))
+    _, triaged = await email_triage(coordinator)
+    assert [order.order_number for order in triaged.confirmations] == ["1234567891"]
+    assert coordinator.triage_cache[2].order_number is None
+    imap_server.add_message(_confirmation("1001"))
+    imap_server.fetched.clear()
+    _, triaged = await email_triage(coordinator)
+    assert {uid for uid, _ in imap_server.fetched} == {3}
+    assert {order.order_number for order in triaged.confirmations} == {"1234567891", "1001"}
+
+
+async def test_email_triage_skips_unreadable_totals_and_receipts(hass, imap_server, imap_session):
+    """A new total or receipt without an order number is marked unreadable, and isn't fetched again."""
+    total = imap_server.add_message(_email("Confirmation of your order changes", "Nothing to see here\n"))
+    receipt = imap_server.add_message(_receipt("unknown", b"%PDF-1.4 not really a receipt"))
+    coordinator = _mock_coordinator(hass, imap_session)
+    _, triaged = await email_triage(coordinator)
+    assert triaged.total is None
+    assert triaged.receipt is None
+    assert coordinator.triage_cache[total].unreadable
+    assert OcadoEmail.from_dict(coordinator.triage_cache[receipt].as_dict()).unreadable
+    assert coordinator.search_date is not None
+    confirmation = imap_server.add_message(_confirmation("1001"))
+    imap_server.fetched.clear()
+    await email_triage(coordinator)
+    assert {uid for uid, _ in imap_server.fetched} == {confirmation}
+
+
+async def test_email_triage_warm_start_from_cache(hass, imap_server, imap_session):
+    """Emails restored from the on-disk cache are not fetched again after a restart."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    await email_triage(coordinator)
+    restarted = _mock_coordinator(hass, imap_session)
+    restarted.uidvalidity = coordinator.uidvalidity
+    assert all("body" not in email.as_dict() for email in coordinator.triage_cache.values())
+    restarted.triage_cache = {uid: OcadoEmail.from_dict(email.as_dict()) for uid, email in coordinator.triage_cache.items()}
+    restarted.order_cache = {uid: OcadoOrder.from_dict(order.as_dict()) for uid, order in coordinator.order_cache.items()}
+    imap_server.add_message(_confirmation("1001"))
+    imap_server.fetched.clear()
+    _, triaged = await email_triage(restarted)
+    assert {uid for uid, _ in imap_server.fetched} == {2}
+    assert {email.order_number for email in triaged.confirmations} == {"1234567891", "1001"}
+
+
+async def test_email_triage_rebuilds_restored_snapshot(hass, imap_server, imap_session):
+    """A snapshot restored at startup is rebuilt from the cache even when no mail has arrived."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    message_ids, _ = await email_triage(coordinator)
+    coordinator.data = {"message_ids": message_ids, "restored": True}
+    imap_server.fetched.clear()
+    _, triaged = await email_triage(coordinator)
+    assert triaged is not None
+    assert imap_server.fetched == []
+
+
+async def test_email_triage_keeps_compact_records(hass, imap_server, imap_session):
+    """Bodies are dropped once parsed, and a confirmation that can't be parsed is skipped rather than failing triage."""
+    imap_server.add_message(_confirmation("1001"))
+    broken = imap_server.add_message(_email("Confirmation of your order", "Order ref.: 1009\n"))
+    coordinator = _mock_coordinator(hass, imap_session)
+    _, triaged = await email_triage(coordinator)
+    assert all(email.body is None for email in coordinator.triage_cache.values())
+    assert all(isinstance(order, OcadoOrder) for order in triaged.confirmations)
+    assert {order.order_number for order in triaged.confirmations} == {"1234567891", "1001"}
+    assert coordinator.triage_cache[broken].order_number == "1009"
+    assert broken not in coordinator.order_cache
+    assert "1009" in triaged.orders
+
+
+def test_snapshot_round_trip():
+    """The coordinator data survives the trip through the JSON cache."""
+    order = OcadoOrder(
+        updated             = datetime(2025, 5, 27, 15, 0, tzinfo=timezone.utc),
+        order_number        = "1001",
+        delivery_datetime   = datetime(2025, 6, 22, 10, 0),
+        delivery_window_end = datetime(2025, 6, 22, 11, 0),
+        edit_datetime       = datetime(2025, 6, 21, 17, 25),
+        estimated_total     = "3.50",
+    )
+    payload = {
+        "updated"       : datetime(2025, 5, 28, tzinfo=timezone.utc),
+        "message_ids"   : [1, 2],
+        "next"          : order,
+        "upcoming"      : None,
+        "total"         : None,
+        "receipt"       : None,
+        "orders"        : [order],
+    }
+    restored = snapshot_from_dict(json.loads(json.dumps(snapshot_to_dict(payload))))
+    assert restored.pop("restored") is True
+    assert restored.pop("next") == order
+    assert restored.pop("orders") == [order]
+    assert restored == {key: value for key, value in payload.items() if key not in ("next", "orders")}
+
+
+async def test_email_triage_is_incremental(hass, imap_server, imap_session):
+    """Only new UIDs are fetched, expunged ones are dropped and a new UIDVALIDITY starts over."""
+    for order_number in ("1001", "1002"):
+        imap_server.add_message(_confirmation(order_number))
+    coordinator = _mock_coordinator(hass, imap_session)
+    message_ids, _ = await email_triage(coordinator)
+    coordinator.data = {"message_ids": message_ids}
+    assert imap_server.commands.count("UID FETCH") == 2
+
+    imap_server.add_message(_confirmation("1003"))
+    imap_server.commands.clear()
+    _, triaged = await email_triage(coordinator)
+    assert imap_server.commands.count("UID FETCH") == 2
+    assert {email.order_number for email in triaged.confirmations} == {"1234567891", "1001", "1002", "1003"}
+
+    imap_server.expunge(2)
+    imap_server.commands.clear()
+    _, triaged = await email_triage(coordinator)
+    assert "UID FETCH" not in imap_server.commands
+    assert {email.order_number for email in triaged.confirmations} == {"1234567891", "1002", "1003"}
+
+    imap_server.uidvalidity = 2
+    imap_server.drop_connections()
+    await asyncio.sleep(0.1)
+    imap_server.commands.clear()
+    _, triaged = await email_triage(coordinator)
+    assert imap_server.commands.count("UID FETCH") == 2
+    assert len(coordinator.triage_cache) == 3
+    assert coordinator.uidvalidity == 2
+
+
+async def test_email_triage_fetches_headers_first(hass, imap_server, imap_session):
+    """Bodies are only downloaded for the emails that can change the result."""
+    marketing = imap_server.add_message(_email("Fresh deals this week", "No order here"))
+    old_total = imap_server.add_message(_email("Confirmation of your order changes", "Order ref.: 1001\nNew total: 1.00 GBP\n"))
+    new_total = imap_server.add_message(_email("Confirmation of your order changes", "Order ref.: 1002\nNew total: 2.00 GBP\n"))
+    coordinator = _mock_coordinator(hass, imap_session)
+    _, triaged = await email_triage(coordinator)
+    bodies = {uid for uid, item in imap_server.fetched if item == "BODY[]"}
+    assert bodies == {1, new_total}
+    assert marketing not in bodies
+    assert old_total not in bodies
+    assert coordinator.triage_cache[marketing].type == "Unknown"
+    assert coordinator.triage_cache[old_total].order_number is None
+    assert triaged.total.order_number == "1002"
+
+
+async def test_email_triage_reads_confirmations_back_to_imap_days(hass, imap_server, imap_session):
+    """A delivery booked well ahead is still found, confirmations are read as far back as imap_days."""
+    booked_ahead = imap_server.add_message(_confirmation("1001", datetime.now(timezone.utc) - timedelta(days=60)))
+    coordinator = _mock_coordinator(hass, imap_session)
+    coordinator.imap_days = 90
+    _, triaged = await email_triage(coordinator)
+    assert {email.order_number for email in triaged.confirmations} == {"1234567891", "1001"}
+    assert (booked_ahead, "BODY[]") in imap_server.fetched
+
+
+async def test_email_triage_fetches_receipt_parts(hass, imap_server, imap_session):
+    """Only the text part and the PDF of the newest receipt are downloaded."""
+    pdf_data = b"%PDF-1.4 not really a receipt" * 100
+    old_receipt = imap_server.add_message(_receipt("1001", pdf_data))
+    receipt = imap_server.add_message(_receipt("1002", pdf_data))
+    coordinator = _mock_coordinator(hass, imap_session)
+    with patch("custom_components.ocado.utils._parse_receipt_in_worker", wraps=_parse_receipt_in_worker) as worker:
+        _, triaged = await email_triage(coordinator)
+    assert triaged.receipt.order_number == "1002"
+    assert worker.call_args.args[1] == pdf_data
+    assert [item for uid, item in imap_server.fetched if uid == receipt] == [
+        "BODY[HEADER.FIELDS (SUBJECT DATE FROM)]",
+        "BODYSTRUCTURE",
+        "BODY[1.1]",
+        "BODY[2]",
+    ]
+    assert {item for uid, item in imap_server.fetched if uid == old_receipt} == {"BODY[HEADER.FIELDS (SUBJECT DATE FROM)]"}
+
+
+async def test_receipt_pdf_extracted_once(hass, imap_session):
+    """The same PDF is only extracted once, even when it turns up in a different message, and the cache stays small."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    ocado_email = OcadoEmail(1, "receipt", None, None, None, None, "1001")
+
+    def parse(ocado_email, pdf_data):
+        return [pdf_data.decode()], OcadoReceipt(None, ocado_email.order_number)
+
+    with patch("custom_components.ocado.utils.MAX_CACHED_PDFS", 2), patch(
+        "custom_components.ocado.utils._parse_receipt_in_worker", side_effect=parse
+    ) as worker, patch("custom_components.ocado.utils.receipt_parse", return_value=OcadoReceipt(None, "1001")) as cached:
+        assert (await _async_receipt_parse(coordinator, ocado_email, b"receipt 1")).order_number == "1001"
+        await _async_receipt_parse(coordinator, ocado_email, b"receipt 1")
+        assert worker.call_count == 1
+        assert cached.call_args.args == (ocado_email, ["receipt 1"])
+        await _async_receipt_parse(coordinator, ocado_email, b"receipt 2")
+        await _async_receipt_parse(coordinator, ocado_email, b"receipt 1")
+        await _async_receipt_parse(coordinator, ocado_email, b"receipt 3")
+    assert worker.call_count == 3
+    assert list(coordinator.pdf_cache.values()) == [["receipt 1"], ["receipt 3"]]
+
+
+def test_receipt_worker_limits():
+    """A PDF that can't be read, or takes too long, gives an empty receipt and leaves no worker behind."""
+    ocado_email = OcadoEmail(1, "receipt", None, None, None, None, "1001")
+    receipt_list, receipt = _parse_receipt_in_worker(ocado_email, b"%PDF-1.4 not really a receipt")
+    assert receipt_list is None
+    assert receipt == OcadoReceipt(None, "1001")
+    with patch("custom_components.ocado.utils.RECEIPT_WORKER_TIMEOUT", 0):
+        assert _parse_receipt_in_worker(ocado_email, b"%PDF-1.4") == (None, OcadoReceipt(None, "1001"))
+    assert multiprocessing.active_children() == []
+
+
+def test_receipt_cache_round_trip():
+    """Receipts survive the trip through the JSON cache."""
+    receipt = OcadoReceipt(
+        updated         = datetime(2025, 6, 22, 9, 0, tzinfo=timezone.utc),
+        order_number    = "1002",
+        bbds            = (("Milk",), (), (), (), (), (), ("Bread", "Eggs")),
+        dates           = tuple(date(2025, 6, 23) + timedelta(days=weekday) for weekday in range(7)),
+        longer          = ("Rice",),
+        columns         = b"".join(RECEIPT_COLUMNS.pack(*row) for row in ((2, 2, 270, 135), (1, 1, 120, -1), (-1, -1, -1, -1), (1, 1, 95, -1))),
+    )
+    restored = OcadoReceipt.from_dict(json.loads(json.dumps(receipt.as_dict())))
+    assert restored == receipt
+    assert hash(restored) == hash(receipt)
+    assert restored.item("Milk") == OcadoReceiptItem("Milk", 0, 2, 2, 270, 135)
+    assert restored.item("Rice") == OcadoReceiptItem("Rice", 7, 1, 1, 95, None)
+    assert restored.item("Cheese") is None
+    assert restored.prices == (270, 120, None, 95)
+
+
+def test_parse_bodystructure():
+    """Leaf parts are numbered the way BODY[section] expects."""
+    parts = parse_bodystructure(
+        b'1 FETCH (UID 5 BODYSTRUCTURE ((("text" "plain" ("charset" "utf-8") NIL NIL "quoted-printable" 120 4 NIL NIL NIL)'
+        b'("text" "html" ("charset" "utf-8") NIL NIL "base64" 900 12 NIL NIL NIL) "alternative" ("boundary" "b1") NIL NIL)'
+        b'("application" "pdf" ("name" "receipt.pdf") NIL NIL "BASE64" 40000 NIL ("attachment" ("filename" "receipt.pdf")) NIL)'
+        b' "mixed" ("boundary" "b0") NIL NIL))'
+    )
+    assert [(part.section, part.content_type, part.encoding) for part in parts] == [
+        ("1.1", "text/plain", "quoted-printable"),
+        ("1.2", "text/html", "base64"),
+        ("2", "application/pdf", "base64"),
+    ]
+    assert parts[0].charset == "utf-8"
+    single = parse_bodystructure(b'1 FETCH (BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "US-ASCII") NIL NIL "7BIT" 3028 92) UID 3)')
+    assert [(part.section, part.content_type) for part in single] == [("1", "text/plain")]
+
+
+def test_decode_transfer_encoding():
+    """Base64 and quoted-printable parts are decoded, anything else passes through."""
+    assert decode_transfer_encoding(b"aGVs\r\nbG8=\r\n", "base64") == b"hello"
+    assert decode_transfer_encoding(b"Order ref.: 1234=\r\n5=20", "quoted-printable") == b"Order ref.: 12345 "
+    assert decode_transfer_encoding(b"plain", "7bit") == b"plain"
+
+
+async def test_fetch_messages_in_batches(imap_server, imap_session):
+    """Messages come back newest first, two per round trip."""
+    for order_number in ("1001", "1002"):
+        imap_server.add_message(_confirmation(order_number))
+    async with imap_session as client:
+        fetched = [uid async for uid, _ in fetch_messages(client, [3, 2, 1], batch_size=2)]
+    assert fetched == [3, 2, 1]
+    assert imap_server.commands.count("UID FETCH") == 2
+
+
+def test_parse_fetch_response_uid_after_literal():
+    """Some servers report the UID after the literal."""
+    response = Response("OK", [b"1 FETCH (BODY[] {3}", bytearray(b"abc"), b" UID 7)", b"FETCH completed"])
+    assert parse_fetch_response(response) == {7: b"abc"}
+
+
+async def test_session_is_reused_between_polls(hass, imap_server, imap_session):
+    """The second poll reuses the logged in session after a NOOP check."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    message_ids, _ = await email_triage(coordinator)
+    coordinator.data = {"message_ids": message_ids}
+    await email_triage(coordinator)
+    assert imap_server.logins == 1
+    assert imap_server.commands[-2:] == ["NOOP", "SELECT"]
+
+
+async def test_session_reconnects_after_drop(hass, imap_server, imap_session):
+    """A connection dropped by the server is replaced transparently."""
+    coordinator = _mock_coordinator(hass, imap_session)
+    await email_triage(coordinator)
+    imap_server.drop_connections()
+    await asyncio.sleep(0.1)
+    message_ids, _ = await email_triage(coordinator)
+    assert message_ids == [1]
+    assert imap_server.logins == 2
+
+
+async def test_idle_wakes_on_new_message(socket_enabled):
+    """IDLE returns as soon as the server pushes a new message."""
+    server = FakeImapServer([], capabilities=("IMAP4rev1", "IDLE"))
+    await server.start()
+    client = await connect_to_server("127.0.0.1", server.port, "test@example.com", "password123", "INBOX", "none")
+    assert client.has_capability("IDLE")
+    waiter = asyncio.create_task(wait_for_folder_change(client))
+    await asyncio.sleep(0.1)
+    server.add_message(_basic_email())
+    assert await asyncio.wait_for(waiter, 1) is True
+    await disconnect_from_server(client)
+    await server.stop()
+
+
+async def test_idle_times_out_quietly(socket_enabled):
+    """An IDLE that sees no changes ends without asking for a refresh."""
+    server = FakeImapServer([], capabilities=("IMAP4rev1", "IDLE"))
+    await server.start()
+    client = await connect_to_server("127.0.0.1", server.port, "test@example.com", "password123", "INBOX", "none")
+    assert await wait_for_folder_change(client, timeout=0.2) is False
+    await disconnect_from_server(client)
+    await server.stop()
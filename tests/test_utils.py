@@ -0,0 +1,308 @@
+"""Test the Ocado helper functions."""
+
+from dataclasses import replace
+from datetime import date, datetime, timedelta, timezone
+from email import message_from_bytes
+from email.message import EmailMessage
+from email.policy import default as default_policy
+from pathlib import Path
+import re
+from unittest.mock import patch
+
+from pypdf import PageObject
+import pytest
+
+from custom_components.ocado.const import MAX_BODY_BYTES, BBDLists, PATTERNS, POLL_INTERVAL_NO_ORDERS, POLL_INTERVAL_WAITING, OcadoEmail, OcadoOrder, OcadoReceiptItem
+from custom_components.ocado.utils import _parse_email, extract_receipt_lines, receipt_parse, get_email_from_datetime, get_next_transition, get_order_number, get_poll_interval, order_parse, total_parse
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+SCAN_INTERVAL = timedelta(minutes=10)
+NOW = datetime(2025, 6, 18, 12, 0)
+
+
+def _order(delivery: datetime, edit: datetime) -> OcadoOrder:
+    return OcadoOrder(
+        updated             = NOW - timedelta(days=3),
+        order_number        = "1001",
+        delivery_datetime   = delivery,
+        delivery_window_end = delivery + timedelta(hours=1),
+        edit_datetime       = edit,
+        estimated_total     = "3.50",
+    )
+
+
+def test_poll_interval_without_orders():
+    """With nothing to wait for, polls back off to hours."""
+    assert get_poll_interval([], NOW, SCAN_INTERVAL) == POLL_INTERVAL_NO_ORDERS
+
+
+def test_poll_interval_waiting_for_an_order():
+    """An order days away is polled hourly."""
+    order = _order(datetime(2025, 6, 22, 10, 0), datetime(2025, 6, 21, 17, 25))
+    assert get_poll_interval([order], NOW, SCAN_INTERVAL) == POLL_INTERVAL_WAITING
+
+
+def test_poll_interval_after_the_edit_deadline():
+    """Just after the edit deadline, polls run at the scan interval."""
+    order = _order(datetime(2025, 6, 19, 10, 0), NOW - timedelta(minutes=30))
+    assert get_poll_interval([order], NOW, SCAN_INTERVAL) == SCAN_INTERVAL
+
+
+def test_poll_interval_on_delivery_day():
+    """The receipt arrives on the delivery day, so the whole day is polled at the scan interval."""
+    order = _order(NOW + timedelta(hours=6), NOW - timedelta(days=1))
+    assert get_poll_interval([order], NOW, SCAN_INTERVAL) == SCAN_INTERVAL
+
+
+def test_poll_interval_wakes_for_the_next_window():
+    """The back off never sleeps past the start of the next window."""
+    order = _order(datetime(2025, 6, 22, 10, 0), NOW + timedelta(minutes=20))
+    assert get_poll_interval([order], NOW, SCAN_INTERVAL) == timedelta(minutes=20)
+    assert get_poll_interval([order], NOW, timedelta(minutes=30)) == timedelta(minutes=30)
+
+
+def test_poll_interval_after_the_last_delivery():
+    """Once the last delivery window has closed there is nothing left to wait for."""
+    order = _order(NOW - timedelta(days=1), NOW - timedelta(days=2))
+    assert get_poll_interval([order], NOW, SCAN_INTERVAL) == POLL_INTERVAL_NO_ORDERS
+
+
+def test_next_transition_is_the_edit_deadline():
+    """The edit deadline comes before the end of the delivery window."""
+    order = _order(datetime(2025, 6, 18, 18, 0), datetime(2025, 6, 18, 14, 0))
+    assert get_next_transition([order], NOW) == datetime(2025, 6, 18, 14, 0)
+
+
+def test_next_transition_is_the_end_of_the_delivery_window():
+    """Once the edit deadline has passed, the end of the delivery window is next."""
+    order = _order(datetime(2025, 6, 18, 18, 0), NOW - timedelta(days=1))
+    assert get_next_transition([order], NOW) == datetime(2025, 6, 18, 19, 0)
+
+
+def test_next_transition_is_midnight():
+    """With nothing else left today the sensors still roll over at midnight."""
+    order = _order(datetime(2025, 6, 22, 10, 0), datetime(2025, 6, 21, 17, 25))
+    assert get_next_transition([order], NOW) == datetime(2025, 6, 19, 0, 0)
+    assert get_next_transition([], NOW) == datetime(2025, 6, 19, 0, 0)
+
+
+def _confirmation_email(body: str, order_number: str | None = None) -> OcadoEmail:
+    return OcadoEmail(
+        message_id          = 1,
+        type                = "confirmation",
+        date                = NOW,
+        from_address        = "noreply@email.ocado.com",
+        subject             = "Confirmation of your order",
+        body                = body,
+        order_number        = order_number,
+    )
+
+
+def _basic_body() -> str:
+    """Return the decoded body of the basic fixture, with the year Ocado includes in the delivery date."""
+    message = message_from_bytes((FIXTURES / "basic.eml").read_bytes(), policy=default_policy)
+    return message.get_body(preferencelist=("plain",)).get_content().replace("Sunday 22 June", "Sunday 22 June 2025") # type: ignore
+
+
+def test_order_parse():
+    """Every field of a confirmation comes out of the one pass over the body."""
+    order = order_parse(_confirmation_email(_basic_body()))
+    assert order.order_number == "1234567891"
+    assert order.delivery_datetime == datetime(2025, 6, 22, 10, 0)
+    assert order.delivery_window_end == datetime(2025, 6, 22, 11, 0)
+    assert order.edit_datetime == datetime(2025, 6, 21, 17, 25)
+    assert order.estimated_total == "3.50"
+
+
+def test_order_parse_twelve_hour_times():
+    """Afternoon slots and edit deadlines written with am/pm are converted to 24 hour times."""
+    body = _basic_body().replace("10:00am and 11:00am", "12:30pm and 1:30pm").replace("17:25 on", "5:25pm on")
+    order = order_parse(_confirmation_email(body, "42"))
+    assert order.order_number == "42"
+    assert order.delivery_datetime == datetime(2025, 6, 22, 12, 30)
+    assert order.delivery_window_end == datetime(2025, 6, 22, 13, 30)
+    assert order.edit_datetime == datetime(2025, 6, 21, 17, 25)
+
+
+def test_order_parse_missing_delivery_date():
+    """A delivery date without a year can't be placed, so the confirmation is rejected as before."""
+    with pytest.raises(ValueError):
+        order_parse(_confirmation_email(_basic_body().replace("22 June 2025", "22 June")))
+
+
+def test_patterns_are_compiled_at_import():
+    """The parsers only look patterns up, none are compiled while parsing."""
+    for patterns in PATTERNS.values():
+        for pattern in patterns.values():
+            assert isinstance(pattern, re.Pattern)
+
+
+def test_get_order_number():
+    assert get_order_number("Your order ref.: 1234567891 is confirmed") == "1234567891"
+    with pytest.raises(ValueError):
+        get_order_number("No number here")
+
+
+def test_total_parse():
+    email = _confirmation_email("New order total:  42.17 GBP", "1001")
+    assert total_parse(email).estimated_total == "42.17"
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        ("Tue, 17 Jun 2025 10:04:05 +0100", datetime(2025, 6, 17, 9, 4, 5, tzinfo=timezone.utc)),
+        ("Tue, 17 Jun 2025 09:04:05 +0000 (UTC)", datetime(2025, 6, 17, 9, 4, 5, tzinfo=timezone.utc)),
+        ("Tue, 17 Jun 2025 09:04:05 -0000", datetime(2025, 6, 17, 9, 4, 5, tzinfo=timezone.utc)),
+        ("sent on 17/06/2025 at 09:04:05 UTC", datetime(2025, 6, 17, 9, 4, 5, tzinfo=timezone.utc)),
+    ],
+)
+def test_get_email_from_datetime(header, expected):
+    """RFC 5322 headers take the fast path, anything else is parsed fuzzily, and the result is always aware."""
+    parsed = get_email_from_datetime(header)
+    assert parsed.tzinfo is not None
+    assert parsed == expected
+
+
+def test_get_email_from_datetime_without_offset():
+    """A header without any zone is taken as local time."""
+    parsed = get_email_from_datetime("17/06/2025 09:04")
+    assert parsed.tzinfo is not None
+    assert parsed.replace(tzinfo=None) == datetime(2025, 6, 17, 9, 4)
+
+
+def _message(content: str, cte: str) -> bytes:
+    message = EmailMessage()
+    message["Subject"] = "Confirmation of your order"
+    message["From"] = "Ocado <noreply@email.ocado.com>"
+    message["Date"] = "Tue, 17 Jun 2025 09:04:05 +0000"
+    message.set_content(content, cte=cte)
+    return message.as_bytes()
+
+
+def test_parse_email_quoted_printable():
+    """An encoded trailing space is no longer glued onto the order number."""
+    ocado_email = _parse_email(1, (FIXTURES / "basic.eml").read_bytes())
+    assert ocado_email.order_number == "1234567891"
+
+
+@pytest.mark.parametrize("cte", ["base64", "quoted-printable", "8bit"])
+def test_parse_email_transfer_encodings(cte):
+    """Bodies are decoded from their transfer encoding and charset, not from re-serialised text."""
+    ocado_email = _parse_email(1, _message("Your order ref.: 1001 for £3.50\n" * 20, cte))
+    assert ocado_email.order_number == "1001"
+    assert "£3.50" in ocado_email.body # type: ignore
+
+
+def test_parse_email_body_budget():
+    """Only the start of a runaway body is decoded, and a truncated base64 body still decodes."""
+    ocado_email = _parse_email(1, _message("Order ref.: 1001\n" + "x" * MAX_BODY_BYTES * 2, "base64"))
+    assert ocado_email.order_number == "1001"
+    assert len(ocado_email.body) <= MAX_BODY_BYTES # type: ignore
+
+
+def test_parse_email_reuses_classified_headers():
+    """Headers already read during triage aren't parsed again, only the body is taken from the message."""
+    headers = replace(_confirmation_email(""), body=None)
+    ocado_email = _parse_email(7, _message("Your order ref.: 1001", "base64"), headers)
+    assert (ocado_email.type, ocado_email.date, ocado_email.subject) == ("confirmation", NOW, headers.subject)
+    assert ocado_email.order_number == "1001"
+
+
+def _receipt_lines() -> list[str]:
+    """Return the text of a small receipt PDF for a delivery on Sunday 22 June 2025, a line per entry."""
+    return ["Ocado"] * 6 + [
+        "Delivery date 22/06/2025",
+        "Order 1001",
+        "Fridge",
+        "Use by end of tomorrow",
+        "Semi skimmed milk 2l",
+        "1/1 1.50",
+        "Wednesday",
+        "Mature cheddar 400g",
+        "1/1 3.00",
+        "Products with a 'use-by' date over one week",
+        "Butter 250g",
+        "1/1 2.00",
+        "You've saved £1.00 today",
+    ]
+
+
+def test_bbd_lists_by_weekday():
+    """Items are filed under the weekday they're to be used by, with that day's date in the week after delivery."""
+    bbd_lists = BBDLists()
+    assert all(bbd_lists.feed(line) for line in _receipt_lines()[:-1])
+    assert not bbd_lists.feed("You've saved £1.00 today")
+    bbd_lists.finish()
+    assert bbd_lists.delivery_date == date(2025, 6, 22)
+    assert bbd_lists.bbds == [["Semi skimmed milk"], [], ["Mature cheddar"], [], [], [], []]
+    assert bbd_lists.longer == ["Butter"]
+    assert bbd_lists.dates == tuple(date(2025, 6, 23) + timedelta(days=weekday) for weekday in range(7))
+
+
+def test_bbd_lists_drop_the_foot_of_the_fridge_section():
+    """The two lines before the Cupboard header aren't items, and items are split on their columns in one go."""
+    receipt_list = _receipt_lines()[:-1] + ["Page 1 of 2", "Summary", "Cupboard", "Use by end of Friday",
+                                            "Ocado white bread 800g (£1.20/each) 1/1 1.20", "You've saved £1.00 today"]
+    bbd_lists = BBDLists()
+    for line in receipt_list:
+        if not bbd_lists.feed(line):
+            break
+    bbd_lists.finish()
+    assert bbd_lists.bbds[4] == ["Ocado white bread"]
+    assert bbd_lists.longer == ["Butter"]
+
+
+def test_receipt_line_items():
+    """Each item keeps its quantities and price, the columns can be on a line of their own."""
+    receipt = receipt_parse(_confirmation_email(""), _receipt_lines()[:-1] + ["Page 1 of 2", "Summary", "Cupboard",
+        "Use by end of Friday", "Ocado white bread 800g (£1.20/each)", "2/2 2.40", "You've saved £1.00 today"])
+    assert receipt.longer == ("Butter",)
+    # In the order of bbds followed by longer, prices in pence
+    assert receipt.delivered == (1, 1, 2, 1)
+    assert receipt.prices == (150, 300, 240, 200)
+    assert receipt.each_prices == (None, None, 120, None)
+    assert receipt.item("Ocado white bread") == OcadoReceiptItem("Ocado white bread", 4, 2, 2, 240, 120)
+    assert receipt.bbds[4] == ("Ocado white bread",)
+
+
+def _receipt_pdf(pages: list[list[str]]) -> bytes:
+    """Build a PDF with a line of text per entry, a page for each list."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        text = b" ".join(b"(" + line.encode("cp1252").replace(b"(", b"\\(").replace(b")", b"\\)") + b") Tj T*" for line in lines)
+        text = b"BT /F1 10 Tf 12 TL 20 800 Td " + text + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(text) + text + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1) + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    return pdf + b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+
+def test_receipt_spilling_onto_a_second_page():
+    """BBD items on a later page are kept, and pages after the end of the BBD sections are never extracted."""
+    lines = _receipt_lines()[:-1]
+    page_break = lines.index("Wednesday")
+    pages = [
+        lines[:page_break],
+        ["Fridge"] + lines[page_break:] + ["Ocado", "Cupboard", "Use by end of Friday", "White bread 800g", "1/1 1.20", "You've saved £1.00 today"],
+        ["Freezer", "Frozen peas 1kg"],
+    ]
+    with patch.object(PageObject, "extract_text", autospec=True, side_effect=PageObject.extract_text) as extract:
+        receipt_list = extract_receipt_lines(_receipt_pdf(pages))
+    assert extract.call_count == 2
+    assert receipt_list is not None
+    assert "Frozen peas 1kg" not in receipt_list
+    receipt = receipt_parse(_confirmation_email(""), receipt_list)
+    assert receipt.bbds[0] == ("Semi skimmed milk",)
+    assert receipt.bbds[2] == ("Mature cheddar",)
+    assert receipt.bbds[4] == ("White bread",)
+    assert receipt.dates[0] == date(2025, 6, 23)